@@ -0,0 +1,389 @@
+"""
+Artifact Catalog
+
+SQLite index of generated stories and images.
+
+Every image written by `generate_image` and every story written by
+`save_formatted_story` is recorded with its size, content hash and
+timestamp; stories also record the book, the personalization profile and
+the images they embed. Images are reference counted by the stories that
+use them, so a retention job can delete old stories and unreferenced
+images without scanning the output directories. Pre-existing files with
+the same content as a cataloged image are kept and recorded as aliases.
+
+    python -m story_crafter_agent.artifact_catalog stats
+    python -m story_crafter_agent.artifact_catalog list --book-id 1268
+    python -m story_crafter_agent.artifact_catalog gc --retention-days 30
+    python -m story_crafter_agent.artifact_catalog reindex
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+ARTIFACT_DB = os.getenv("ARTIFACT_DB", "artifacts.db")
+STORIES_DIR = "output_stories"
+IMAGES_DIR = "generated_images"
+
+# Unreferenced images younger than this are kept: they may belong to a
+# story that is still being formatted.
+ORPHAN_GRACE_SECONDS = 6 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    sha256      TEXT PRIMARY KEY,
+    filename    TEXT NOT NULL,
+    path        TEXT NOT NULL,
+    prompt      TEXT,
+    size_bytes  INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    refcount    INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_images_filename ON images(filename);
+DROP INDEX IF EXISTS idx_images_prompt;
+CREATE INDEX IF NOT EXISTS idx_images_orphans ON images(refcount, created_at);
+
+-- Other files with the same content as a cataloged image (found by reindex)
+CREATE TABLE IF NOT EXISTS image_aliases (
+    filename     TEXT PRIMARY KEY,
+    path         TEXT NOT NULL,
+    image_sha256 TEXT NOT NULL REFERENCES images(sha256)
+);
+CREATE INDEX IF NOT EXISTS idx_image_aliases_image ON image_aliases(image_sha256);
+
+CREATE TABLE IF NOT EXISTS stories (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    path         TEXT NOT NULL UNIQUE,
+    book_id      TEXT,
+    book_title   TEXT,
+    user_id      TEXT,
+    profile_json TEXT,
+    size_bytes   INTEGER NOT NULL,
+    created_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stories_book ON stories(book_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stories_user ON stories(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stories_created ON stories(created_at);
+
+CREATE TABLE IF NOT EXISTS story_images (
+    story_id     INTEGER NOT NULL REFERENCES stories(id) ON DELETE CASCADE,
+    image_sha256 TEXT NOT NULL REFERENCES images(sha256),
+    PRIMARY KEY (story_id, image_sha256)
+);
+CREATE INDEX IF NOT EXISTS idx_story_images_image ON story_images(image_sha256);
+"""
+
+_IMAGE_LINK = re.compile(r'(?:!\[[^\]]*\]\(([^)\s]+)\)|<img[^>]*\ssrc="([^"]+)")')
+
+
+def image_filenames(markdown: str) -> List[str]:
+    """File names of the images a story embeds, in order and deduplicated."""
+    names = []
+    for match in _IMAGE_LINK.finditer(markdown):
+        name = os.path.basename(match.group(1) or match.group(2))
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class ArtifactCatalog:
+    """Thread-safe access to the catalog database (one connection per thread)."""
+
+    def __init__(self, db_path: str = ARTIFACT_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def record_image(self, path: str, prompt: Optional[str] = None, keep_duplicate: bool = False) -> str:
+        """
+        Record a generated image file.
+
+        Images are keyed by content. If an identical image is already
+        cataloged, the new file is removed and the existing path is returned,
+        unless `keep_duplicate` is set (for files that stories may already
+        embed): then the file is kept and recorded as an alias. If the
+        cataloged file no longer exists, the record moves to the new file.
+
+        Returns:
+            Absolute path of the cataloged image.
+        """
+        path = os.path.abspath(path)
+        data = Path(path).read_bytes()
+        sha256 = hashlib.sha256(data).hexdigest()
+        filename = os.path.basename(path)
+        with self._connect() as conn:
+            existing = conn.execute("SELECT path FROM images WHERE sha256 = ?", (sha256,)).fetchone()
+            if existing is None:
+                conn.execute(
+                    "INSERT INTO images (sha256, filename, path, prompt, size_bytes, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (sha256, filename, path, prompt, len(data), time.time()),
+                )
+                return path
+            if existing["path"] == path:
+                return path
+            if not os.path.exists(existing["path"]):
+                conn.execute("DELETE FROM image_aliases WHERE filename = ?", (filename,))
+                conn.execute("UPDATE images SET path = ?, filename = ? WHERE sha256 = ?", (path, filename, sha256))
+                return path
+            if keep_duplicate:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_aliases (filename, path, image_sha256) VALUES (?, ?, ?)",
+                    (filename, path, sha256),
+                )
+                return path
+        os.unlink(path)
+        return existing["path"]
+
+    def record_story(
+        self,
+        path: str,
+        markdown: str,
+        book_id: Optional[str] = None,
+        book_title: Optional[str] = None,
+        profile: Optional[Dict[str, Any]] = None,
+        user_id: Optional[str] = None,
+    ) -> int:
+        """
+        Record a saved story and take a reference on every cataloged image it embeds.
+
+        Re-saving to the same path replaces the previous record.
+        """
+        names = image_filenames(markdown)
+        with self._connect() as conn:
+            previous = conn.execute("SELECT id FROM stories WHERE path = ?", (os.path.abspath(path),)).fetchone()
+            if previous is not None:
+                self._delete_story(conn, previous["id"])
+            cursor = conn.execute(
+                "INSERT INTO stories (path, book_id, book_title, user_id, profile_json, size_bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), book_id, book_title, user_id,
+                 json.dumps(profile) if profile else None, os.path.getsize(path), time.time()),
+            )
+            story_id = cursor.lastrowid
+            if names:
+                placeholders = ",".join("?" * len(names))
+                hashes = [row["sha256"] for row in conn.execute(
+                    f"SELECT sha256 FROM images WHERE filename IN ({placeholders}) "
+                    f"UNION SELECT image_sha256 FROM image_aliases WHERE filename IN ({placeholders})",
+                    names + names)]
+                conn.executemany(
+                    "INSERT OR IGNORE INTO story_images (story_id, image_sha256) VALUES (?, ?)",
+                    [(story_id, h) for h in hashes],
+                )
+                conn.executemany("UPDATE images SET refcount = refcount + 1 WHERE sha256 = ?",
+                                 [(h,) for h in hashes])
+        return story_id
+
+    @staticmethod
+    def _delete_story(conn: sqlite3.Connection, story_id: int) -> None:
+        """Drop a story row and its image references (caller owns the transaction)."""
+        conn.execute(
+            "UPDATE images SET refcount = refcount - 1 WHERE sha256 IN "
+            "(SELECT image_sha256 FROM story_images WHERE story_id = ?)", (story_id,))
+        conn.execute("DELETE FROM stories WHERE id = ?", (story_id,))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def list_stories(
+        self,
+        book_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Most recent stories, optionally filtered by book and user."""
+        clauses, params = [], []
+        if book_id:
+            clauses.append("book_id = ?")
+            params.append(book_id)
+        if user_id:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT * FROM stories {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        stories = []
+        for row in rows:
+            story = dict(row)
+            story["profile"] = json.loads(story.pop("profile_json") or "null")
+            story["images"] = [r["image_sha256"] for r in self._connect().execute(
+                "SELECT image_sha256 FROM story_images WHERE story_id = ?", (row["id"],))]
+            stories.append(story)
+        return stories
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connect()
+        stories = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size_bytes), 0) AS bytes FROM stories").fetchone()
+        images = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size_bytes), 0) AS bytes FROM images").fetchone()
+        orphans = conn.execute("SELECT COUNT(*) AS n FROM images WHERE refcount = 0").fetchone()
+        return {
+            "stories": stories["n"],
+            "story_bytes": stories["bytes"],
+            "images": images["n"],
+            "image_bytes": images["bytes"],
+            "unreferenced_images": orphans["n"],
+        }
+
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+
+    def collect_garbage(
+        self,
+        retention_days: Optional[float] = None,
+        orphan_grace_seconds: float = ORPHAN_GRACE_SECONDS,
+        dry_run: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Delete expired stories and unreferenced images.
+
+        Args:
+            retention_days: Delete stories older than this (None keeps all stories).
+            orphan_grace_seconds: Only delete unreferenced images older than this.
+            dry_run: Report what would be deleted without deleting.
+
+        Returns:
+            Counts of deleted stories, images and freed bytes.
+        """
+        now = time.time()
+        conn = self._connect()
+        result = {"stories": 0, "images": 0, "bytes": 0}
+
+        if retention_days is not None:
+            expired = conn.execute(
+                "SELECT id, path, size_bytes FROM stories WHERE created_at < ?",
+                (now - retention_days * 86400,),
+            ).fetchall()
+            for row in expired:
+                result["stories"] += 1
+                result["bytes"] += row["size_bytes"]
+                if dry_run:
+                    continue
+                with conn:
+                    self._delete_story(conn, row["id"])
+                Path(row["path"]).unlink(missing_ok=True)
+
+        orphans = conn.execute(
+            "SELECT sha256, path, size_bytes FROM images WHERE refcount <= 0 AND created_at < ?",
+            (now - orphan_grace_seconds,),
+        ).fetchall()
+        for row in orphans:
+            result["images"] += 1
+            result["bytes"] += row["size_bytes"]
+            if dry_run:
+                continue
+            aliases = [r["path"] for r in conn.execute(
+                "SELECT path FROM image_aliases WHERE image_sha256 = ?", (row["sha256"],))]
+            with conn:
+                conn.execute(
+                    "DELETE FROM image_aliases WHERE image_sha256 IN "
+                    "(SELECT sha256 FROM images WHERE sha256 = ? AND refcount <= 0)", (row["sha256"],))
+                deleted = conn.execute(
+                    "DELETE FROM images WHERE sha256 = ? AND refcount <= 0", (row["sha256"],)).rowcount
+            if not deleted:
+                continue
+            for path in [row["path"], *aliases]:
+                Path(path).unlink(missing_ok=True)
+        return result
+
+    def reindex(self, stories_dir: str = STORIES_DIR, images_dir: str = IMAGES_DIR) -> Dict[str, int]:
+        """
+        Catalog files written before the catalog existed.
+
+        No file is ever deleted: images with the same content as a cataloged
+        one are recorded as aliases, since stories may embed either file.
+        """
+        conn = self._connect()
+        known_images = {r["filename"] for r in conn.execute(
+            "SELECT filename FROM images UNION SELECT filename FROM image_aliases")}
+        known_stories = {r["path"] for r in conn.execute("SELECT path FROM stories")}
+        added = {"images": 0, "stories": 0}
+
+        for file_path in Path(images_dir).glob("*.png"):
+            if file_path.name not in known_images:
+                self.record_image(str(file_path), keep_duplicate=True)
+                added["images"] += 1
+        for file_path in Path(stories_dir).glob("*.md"):
+            if str(file_path.absolute()) not in known_stories:
+                markdown = file_path.read_text(encoding="utf-8", errors="replace")
+                book_id = file_path.name.split("_", 1)[0]
+                self.record_story(str(file_path), markdown, book_id=book_id if book_id.isdigit() else None)
+                added["stories"] += 1
+        return added
+
+
+_catalog: Optional[ArtifactCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_artifact_catalog() -> ArtifactCatalog:
+    """Return the process-wide artifact catalog."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ArtifactCatalog()
+        return _catalog
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Query and maintain the generated artifact catalog.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="Show catalog totals")
+    list_parser = commands.add_parser("list", help="List recent stories")
+    list_parser.add_argument("--book-id")
+    list_parser.add_argument("--user-id")
+    list_parser.add_argument("--limit", type=int, default=20)
+    gc_parser = commands.add_parser("gc", help="Delete expired stories and unreferenced images")
+    gc_parser.add_argument("--retention-days", type=float, default=None)
+    gc_parser.add_argument("--orphan-grace-hours", type=float, default=ORPHAN_GRACE_SECONDS / 3600)
+    gc_parser.add_argument("--dry-run", action="store_true")
+    commands.add_parser("reindex", help="Catalog existing files in output_stories/ and generated_images/")
+    args = parser.parse_args(argv)
+
+    catalog = get_artifact_catalog()
+    if args.command == "stats":
+        result = catalog.stats()
+    elif args.command == "list":
+        result = catalog.list_stories(book_id=args.book_id, user_id=args.user_id, limit=args.limit)
+    elif args.command == "gc":
+        result = catalog.collect_garbage(
+            retention_days=args.retention_days,
+            orphan_grace_seconds=args.orphan_grace_hours * 3600,
+            dry_run=args.dry_run,
+        )
+    else:
+        result = catalog.reindex()
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -65,28 +65,223 @@ else:
 
 print("="*70 + "\n")
 
-from fastapi import FastAPI
+import json
+from typing import List, Literal, Optional
+
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from google.adk.cli.fast_api import get_fast_api_app
+from pydantic import BaseModel, Field
 
 from story_crafter_agent.sub_agents.illustration_agent import illustration_agent
 from story_crafter_agent.sub_agents.formatter_agent import formatter_agent
 from story_crafter_agent.sub_agents.storyteller_agent import storyteller_agent
 from story_crafter_agent.sub_agents.personalization_agent import personalization_agent
+from story_crafter_agent.artifact_catalog import get_artifact_catalog
+from story_crafter_agent.profiling import (
+    MAX_ARMED_PROFILES,
+    ProfilingMiddleware,
+    check_admin_token,
+    get_loop_monitor,
+    get_profile_store,
+    profiling_enabled,
+    should_profile,
+)
+from story_crafter_agent.scheduler import AdmissionMiddleware, QueueFullError, get_scheduler
+from story_crafter_agent.story_jobs import get_job_manager
+from story_crafter_agent.tools.library_backends import get_library_backend
 
 AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALLOW_ORIGINS = [o.strip() for o in os.getenv("ALLOW_ORIGINS", "*").split(",") if o.strip()]
+# Database URL for sessions (e.g. sqlite:///sessions.db); unset keeps them in memory.
+# Required with several workers, which `serve.py` sets up automatically.
+SESSION_SERVICE_URI = os.getenv("SESSION_SERVICE_URI") or None
+
+session_db_kwargs = None
+if SESSION_SERVICE_URI and SESSION_SERVICE_URI.startswith("sqlite"):
+    from sqlalchemy.pool import NullPool
+
+    # No pooled connections, so none is shared by workers forked after the app loads
+    session_db_kwargs = {"poolclass": NullPool, "connect_args": {"timeout": 30}}
 
 # Create FastAPI app with ADK integration
 # Note: We disable OpenAPI schema generation for complex types
 app: FastAPI = get_fast_api_app(
     agents=[personalization_agent, storyteller_agent, illustration_agent, formatter_agent],
     web=True,
-    allow_origins=["*"],  # Configure as needed for production
-    session_service_uri=None,  # In-memory sessions
+    allow_origins=ALLOW_ORIGINS,  # Set ALLOW_ORIGINS in production
+    session_service_uri=SESSION_SERVICE_URI,
+    session_db_kwargs=session_db_kwargs,
 )
 
 app.title = "Illustrated Summary Agent"
 app.description = "ADK Agent for Personalized Illustrated Summaries of Classic Literature"
 
+# Opt-in profiling (X-Profile header or armed slots) and loop lag monitoring.
+app.add_middleware(ProfilingMiddleware, paths=("/run", "/run_sse"))
+# Conversational runs: X-Priority, and 429 while the pipeline queue is full.
+# The pipeline itself is admitted when the run reaches the storyteller.
+app.add_middleware(AdmissionMiddleware, paths=("/run", "/run_sse"))
+
+
+def _queue_full(e: QueueFullError) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(e), "retry_after": e.retry_after},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """A /run that filled up the queue between the admission check and the storyteller."""
+    return _queue_full(exc)
+
+
+# One-shot story generation: book + full profile in, story job out
+class StoryRequest(BaseModel):
+    book_id: str = Field(min_length=1, max_length=32, pattern=r"^[A-Za-z0-9_-]+$")
+    audience: str = Field(min_length=1, max_length=100)
+    tone: str = Field(min_length=1, max_length=100)
+    length: Literal["Short", "Medium", "Full"]
+    originality_score: float = Field(ge=0.0, le=1.0)
+    special_adaptations: List[str] = Field(default_factory=list, max_length=20)
+    priority: Literal["interactive", "batch"] = "interactive"
+
+
+def _sse(events):
+    async def _format():
+        async for event in events:
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    return StreamingResponse(_format(), media_type="text/event-stream")
+
+
+@app.post("/stories", status_code=202)
+async def create_story(request: StoryRequest, http_request: Request, stream: bool = False):
+    """Start a story job directly at the storytelling stage."""
+    try:
+        await run_in_threadpool(get_library_backend().get_book, request.book_id)
+    except (KeyError, FileNotFoundError) as e:
+        raise HTTPException(status_code=404, detail=f"Unknown book_id {request.book_id}: {e}")
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail=f"Unknown book_id {request.book_id}")
+        raise HTTPException(status_code=502, detail=f"Library lookup failed: {e}")
+    except httpx.TransportError as e:
+        raise HTTPException(status_code=503, detail=f"Library unavailable: {e.__class__.__name__}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Library lookup failed: {e}")
+
+    profile = request.model_dump(exclude={"priority"})
+    profiled = await should_profile({k.lower(): v for k, v in http_request.headers.items()})
+    try:
+        job = await get_job_manager().submit(profile, priority=request.priority, profiled=profiled)
+    except QueueFullError as e:
+        return _queue_full(e)
+    if stream:
+        return _sse(job.stream())
+    return {
+        "job_id": job.id,
+        "state": job.state,
+        "status_url": f"/stories/{job.id}",
+        "events_url": f"/stories/{job.id}/events",
+    }
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Queue depth, wait times and stage usage of the pipeline scheduler."""
+    return get_scheduler().stats()
+
+
+def _require_admin(token: Optional[str]) -> None:
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILE_ADMIN_TOKEN to enable it")
+    if not check_admin_token(token):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
+
+
+@app.post("/admin/profiling/arm")
+async def arm_profiling(
+    count: int = Query(1, ge=1, le=MAX_ARMED_PROFILES),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """Profile the next `count` pipeline runs (at most MAX_ARMED_PROFILES armed at once)."""
+    _require_admin(x_admin_token)
+    return {"armed": await run_in_threadpool(get_profile_store().arm, count)}
+
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Completed profiles in this process, most recent first."""
+    _require_admin(x_admin_token)
+    return await run_in_threadpool(get_profile_store().list)
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    format: Literal["json", "speedscope", "collapsed"] = "json",
+    x_admin_token: Optional[str] = Header(None),
+):
+    """A profile as a JSON summary, a speedscope file or collapsed stacks for flamegraphs."""
+    _require_admin(x_admin_token)
+    session = await run_in_threadpool(get_profile_store().get, profile_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown profile {profile_id}")
+    if format == "collapsed":
+        return PlainTextResponse(
+            session.to_collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'},
+        )
+    if format == "speedscope":
+        return JSONResponse(
+            session.to_speedscope(),
+            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+        )
+    return session.to_dict()
+
+
+@app.get("/admin/loop-lag")
+async def loop_lag(x_admin_token: Optional[str] = Header(None)):
+    """Event loop stalls over the threshold, with the stack that blocked the loop."""
+    _require_admin(x_admin_token)
+    return get_loop_monitor().stats()
+
+
+@app.get("/artifacts/stories")
+async def list_story_artifacts(
+    book_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """List saved stories from the artifact catalog, most recent first."""
+    return await run_in_threadpool(
+        get_artifact_catalog().list_stories, book_id=book_id, user_id=user_id, limit=limit, offset=offset
+    )
+
+
+@app.get("/stories/{job_id}")
+async def get_story(job_id: str):
+    """Poll a story job."""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job.to_dict()
+
+
+@app.get("/stories/{job_id}/events")
+async def stream_story_events(job_id: str, after: int = 0):
+    """Stream a story job's progress as server-sent events."""
+    job = await get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return _sse(job.stream(after))
+
+
 # Override OpenAPI schema to handle Pydantic validation issues
 # This is a workaround for complex ADK types in the schema
 def custom_openapi():
@@ -177,6 +372,231 @@ def custom_openapi():
                     }
                 }
             },
+            "/stories": {
+                "post": {
+                    "summary": "Create Story",
+                    "description": "Generate a story from a book ID and a complete personalization profile, "
+                                   "skipping the conversational agents. Returns a job handle, or a "
+                                   "server-sent event stream with `?stream=true`.",
+                    "parameters": [
+                        {
+                            "name": "stream",
+                            "in": "query",
+                            "required": False,
+                            "schema": {"type": "boolean", "default": False}
+                        },
+                        {
+                            "name": "X-Profile",
+                            "in": "header",
+                            "required": False,
+                            "description": "Set to 1 to profile the run (with X-Admin-Token, when PROFILE_ADMIN_TOKEN "
+                                           "is set); the job reports its profile_id",
+                            "schema": {"type": "string"}
+                        }
+                    ],
+                    "requestBody": {
+                        "content": {
+                            "application/json": {
+                                "schema": {
+                                    "type": "object",
+                                    "properties": {
+                                        "book_id": {"type": "string"},
+                                        "audience": {"type": "string"},
+                                        "tone": {"type": "string"},
+                                        "length": {"type": "string", "enum": ["Short", "Medium", "Full"]},
+                                        "originality_score": {"type": "number", "minimum": 0, "maximum": 1},
+                                        "special_adaptations": {"type": "array", "items": {"type": "string"}},
+                                        "priority": {"type": "string", "enum": ["interactive", "batch"], "default": "interactive"}
+                                    },
+                                    "required": ["book_id", "audience", "tone", "length", "originality_score"]
+                                }
+                            }
+                        }
+                    },
+                    "responses": {
+                        "202": {
+                            "description": "Story job accepted",
+                            "content": {
+                                "application/json": {
+                                    "schema": {
+                                        "type": "object",
+                                        "properties": {
+                                            "job_id": {"type": "string"},
+                                            "state": {"type": "string"},
+                                            "status_url": {"type": "string"},
+                                            "events_url": {"type": "string"}
+                                        }
+                                    }
+                                }
+                            }
+                        },
+                        "404": {"description": "Unknown book_id"},
+                        "422": {"description": "Invalid profile"},
+                        "429": {"description": "Pipeline queue is full; see the Retry-After header"},
+                        "502": {"description": "The library backend failed to look up the book"},
+                        "503": {"description": "The library backend is unreachable"}
+                    }
+                }
+            },
+            "/scheduler/stats": {
+                "get": {
+                    "summary": "Scheduler Stats",
+                    "description": "Active and queued pipelines, wait-time percentiles per priority and stage usage",
+                    "responses": {
+                        "200": {
+                            "description": "Successful Response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/admin/profiling/arm": {
+                "post": {
+                    "summary": "Arm Profiling",
+                    "description": "Profile the next `count` pipeline runs (CPU samples, allocations, loop stalls). "
+                                   f"At most {MAX_ARMED_PROFILES} runs are armed at once. "
+                                   "Only available when PROFILE_ADMIN_TOKEN is set.",
+                    "parameters": [
+                        {"name": "count", "in": "query", "required": False,
+                         "schema": {"type": "integer", "default": 1, "minimum": 1, "maximum": MAX_ARMED_PROFILES}},
+                        {"name": "X-Admin-Token", "in": "header", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "responses": {
+                        "200": {"description": "Number of armed runs"},
+                        "403": {"description": "Invalid or missing admin token"},
+                        "404": {"description": "Profiling is disabled (PROFILE_ADMIN_TOKEN not set)"}
+                    }
+                }
+            },
+            "/admin/profiles": {
+                "get": {
+                    "summary": "List Profiles",
+                    "description": "Completed profiles in this worker process, most recent first",
+                    "parameters": [
+                        {"name": "X-Admin-Token", "in": "header", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful Response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"type": "array", "items": {"type": "object"}}
+                                }
+                            }
+                        },
+                        "403": {"description": "Invalid or missing admin token"},
+                        "404": {"description": "Profiling is disabled (PROFILE_ADMIN_TOKEN not set)"}
+                    }
+                }
+            },
+            "/admin/profiles/{profile_id}": {
+                "get": {
+                    "summary": "Download Profile",
+                    "description": "A profile as JSON summary, speedscope file or collapsed stacks (flamegraph.pl input)",
+                    "parameters": [
+                        {"name": "profile_id", "in": "path", "required": True, "schema": {"type": "string"}},
+                        {"name": "format", "in": "query", "required": False,
+                         "schema": {"type": "string", "enum": ["json", "speedscope", "collapsed"], "default": "json"}},
+                        {"name": "X-Admin-Token", "in": "header", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "responses": {
+                        "200": {"description": "Profile"},
+                        "403": {"description": "Invalid or missing admin token"},
+                        "404": {"description": "Unknown profile, or profiling is disabled"}
+                    }
+                }
+            },
+            "/admin/loop-lag": {
+                "get": {
+                    "summary": "Event Loop Lag",
+                    "description": "Event loop stalls over LOOP_LAG_THRESHOLD_MS with the blocking stack",
+                    "parameters": [
+                        {"name": "X-Admin-Token", "in": "header", "required": True, "schema": {"type": "string"}}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful Response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"type": "object"}
+                                }
+                            }
+                        },
+                        "403": {"description": "Invalid or missing admin token"},
+                        "404": {"description": "Profiling is disabled (PROFILE_ADMIN_TOKEN not set)"}
+                    }
+                }
+            },
+            "/artifacts/stories": {
+                "get": {
+                    "summary": "List Stories",
+                    "description": "Saved stories from the artifact catalog with book, profile and image hashes",
+                    "parameters": [
+                        {"name": "book_id", "in": "query", "required": False, "schema": {"type": "string"}},
+                        {"name": "user_id", "in": "query", "required": False, "schema": {"type": "string"}},
+                        {"name": "limit", "in": "query", "required": False, "schema": {"type": "integer", "default": 50}},
+                        {"name": "offset", "in": "query", "required": False, "schema": {"type": "integer", "default": 0}}
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Successful Response",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"type": "array", "items": {"type": "object"}}
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/stories/{job_id}": {
+                "get": {
+                    "summary": "Get Story Job",
+                    "description": "Poll the state and result of a story job",
+                    "parameters": [
+                        {
+                            "name": "job_id",
+                            "in": "path",
+                            "required": True,
+                            "schema": {"type": "string"}
+                        }
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Job state, result and error",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"type": "object"}
+                                }
+                            }
+                        }
+                    }
+                }
+            },
+            "/stories/{job_id}/events": {
+                "get": {
+                    "summary": "Stream Story Job Events",
+                    "description": "Server-sent events with the progress of a story job",
+                    "parameters": [
+                        {
+                            "name": "job_id",
+                            "in": "path",
+                            "required": True,
+                            "schema": {"type": "string"}
+                        }
+                    ],
+                    "responses": {
+                        "200": {
+                            "description": "Event stream",
+                            "content": {"text/event-stream": {}}
+                        }
+                    }
+                }
+            },
             "/sessions/{session_id}/messages": {
                 "post": {
                     "summary": "Send Message",
@@ -228,7 +648,14 @@ app.openapi = custom_openapi
 
 # Main execution
 if __name__ == "__main__":
-    import uvicorn
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        # Pre-forked workers sharing the snapshot and caches
+        from story_crafter_agent.serve import serve
+
+        serve(workers=workers, port=8086)
+    else:
+        import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8086)
+        uvicorn.run(app, host="0.0.0.0", port=8086)
 
@@ -0,0 +1,573 @@
+"""
+Profiling
+
+Opt-in CPU and memory profiling of pipeline runs, and event loop lag
+monitoring.
+
+- `ProfileSession`: while active, a background thread samples the Python
+  stacks of every thread (`sys._current_frames`) and tracemalloc records
+  allocations. The result is kept in memory and can be downloaded in
+  speedscope or collapsed-stack (flamegraph.pl / inferno) format. Sampling
+  is process-wide, so concurrent requests show up in each other's profiles.
+  In multi-worker mode completed profiles and armed slots live in the
+  shared cache, so any worker can serve them.
+- `LoopLagMonitor`: a heartbeat task measures how late the event loop wakes
+  up, and a watchdog thread captures the loop thread's stack while it is
+  stuck, so every blocking call over the threshold is reported with the
+  code that caused it.
+
+Profiling is disabled unless `PROFILE_ADMIN_TOKEN` is set. Then a run is
+profiled when it carries an `X-Profile: 1` header, or when slots were armed
+with `POST /admin/profiling/arm`; both require a matching `X-Admin-Token`
+header.
+"""
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Tuple, Deque
+
+from story_crafter_agent.shared_state import SharedCache, get_shared_cache
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "true").lower() in ("1", "true", "yes")
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000
+
+# Completed profiles kept for download (oldest dropped first)
+MAX_PROFILES = 20
+# Runs that can be armed for profiling at once
+MAX_ARMED_PROFILES = 10
+# Completed profiles in the shared cache expire after this long
+SHARED_PROFILE_TTL = 24 * 3600
+# Allocation sites reported per profile
+MEMORY_TOP_N = 30
+
+Frame = Tuple[str, str, int]  # (function, file, first line)
+
+# Leaf frames of threads that are just waiting for work
+_IDLE_LEAVES = {
+    ("wait", "threading.py"),
+    ("get", "queue.py"),
+    ("_worker", "thread.py"),
+    ("select", "selectors.py"),
+}
+
+
+def _short_path(path: str) -> str:
+    """Path relative to site-packages or the project, for readable frame names."""
+    index = path.rfind("site-packages" + os.sep)
+    if index != -1:
+        return path[index + len("site-packages") + 1:]
+    index = path.rfind("story_crafter_agent" + os.sep)
+    if index != -1:
+        return path[index:]
+    return os.path.basename(path)
+
+
+def _walk(frame) -> List[Frame]:
+    """Stack of `frame`, outermost call first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def format_stack(frame) -> List[str]:
+    """Readable stack of `frame` with current line numbers, outermost first."""
+    lines = []
+    while frame is not None:
+        lines.append(f"{_short_path(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}")
+        frame = frame.f_back
+    lines.reverse()
+    return lines
+
+
+def _frame_name(frame: Frame) -> str:
+    name, path, line = frame
+    return f"{name} ({_short_path(path)}:{line})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads every `interval` seconds."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL, main_thread_id: Optional[int] = None):
+        self.interval = interval
+        self.main_thread_id = main_thread_id
+        self.samples: Counter = Counter()  # (thread name, *frames) -> count
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _walk(frame)
+                if not stack:
+                    continue
+                leaf = (stack[-1][0], os.path.basename(stack[-1][1]))
+                # Idle pool threads would drown the profile; the loop's idle time is kept
+                if leaf in _IDLE_LEAVES and thread_id != self.main_thread_id:
+                    continue
+                self.samples[(names.get(thread_id, str(thread_id)), *stack)] += 1
+            self.sample_count += 1
+
+
+# tracemalloc is process-wide: it runs while any session needs it, and is
+# left alone if something else started it
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _tracemalloc_acquire() -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _tracemalloc_release() -> None:
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+class ProfileSession:
+    """CPU samples, allocation diff and loop stalls of one profiled run."""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started_at: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.profiler = SamplingProfiler(main_thread_id=threading.get_ident())
+        self.memory: Dict[str, Any] = {}
+        self.loop_stalls: List[Dict[str, Any]] = []
+        self._start_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._t0 = 0.0
+
+    def start(self) -> None:
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        _tracemalloc_acquire()
+        tracemalloc.reset_peak()
+        self._start_snapshot = tracemalloc.take_snapshot()
+        self.profiler.start()
+
+    def stop(self) -> None:
+        self.profiler.stop()
+        self.duration = time.perf_counter() - self._t0
+        try:
+            end_snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            diffs = end_snapshot.filter_traces(filters).compare_to(
+                self._start_snapshot.filter_traces(filters), "lineno"
+            )
+            self.memory = {
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "top_allocations": [
+                    {
+                        "location": f"{_short_path(d.traceback[0].filename)}:{d.traceback[0].lineno}",
+                        "size_diff": d.size_diff,
+                        "count_diff": d.count_diff,
+                        "size": d.size,
+                    }
+                    for d in diffs[:MEMORY_TOP_N]
+                ],
+            }
+        finally:
+            self._start_snapshot = None
+            _tracemalloc_release()
+        self.loop_stalls = get_loop_monitor().events_since(self.started_at)
+        get_profile_store().add(self)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "profile_id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration or 0.0, 3),
+            "samples": self.profiler.sample_count,
+            "peak_bytes": self.memory.get("peak_bytes"),
+            "loop_stalls": len(self.loop_stalls),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        top = Counter()
+        for key, count in self.profiler.samples.items():
+            top[_frame_name(key[-1])] += count
+        return {
+            **self.summary(),
+            "interval_seconds": self.profiler.interval,
+            "top_functions": [{"frame": name, "samples": n} for name, n in top.most_common(30)],
+            "memory": self.memory,
+            "loop_stall_events": self.loop_stalls,
+        }
+
+    def to_collapsed(self) -> str:
+        """Collapsed stacks ("thread;outer;...;inner count"), the flamegraph.pl input format."""
+        lines = []
+        for (thread, *stack), count in sorted(self.profiler.samples.items(), key=lambda kv: -kv[1]):
+            names = [thread] + [_frame_name(f).replace(";", ",") for f in stack]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """Speedscope file with one sampled profile per thread (weights in seconds)."""
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Frame, int] = {}
+        by_thread: Dict[str, Dict[str, list]] = OrderedDict()
+        for (thread, *stack), count in self.profiler.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": _short_path(frame[1]), "line": frame[2]})
+                indexes.append(frame_index[frame])
+            profile = by_thread.setdefault(thread, {"samples": [], "weights": []})
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.profiler.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.label} ({self.id})",
+            "exporter": "story_crafter_agent",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(p["weights"]),
+                    "samples": p["samples"],
+                    "weights": p["weights"],
+                }
+                for thread, p in by_thread.items()
+            ],
+        }
+
+
+class StoredProfile:
+    """A completed profile read back from the shared cache, with the accessors of `ProfileSession`."""
+
+    def __init__(self, record: Dict[str, Any]):
+        self._record = record
+
+    @classmethod
+    def from_session(cls, session: ProfileSession) -> "StoredProfile":
+        return cls({
+            "summary": session.summary(),
+            "dict": session.to_dict(),
+            "collapsed": session.to_collapsed(),
+            "speedscope": session.to_speedscope(),
+        })
+
+    def summary(self) -> Dict[str, Any]:
+        return self._record["summary"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._record["dict"]
+
+    def to_collapsed(self) -> str:
+        return self._record["collapsed"]
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        return self._record["speedscope"]
+
+
+class ProfileStore:
+    """
+    Completed profiles, plus armed slots for upcoming runs.
+
+    Kept in this process, or in a `SharedCache` seen by every worker. The
+    shared methods do blocking SQLite I/O; call them off the event loop.
+    """
+
+    _ARMED_KEY = "profiling:armed"
+
+    def __init__(
+        self,
+        max_profiles: int = MAX_PROFILES,
+        shared: Optional[SharedCache] = None,
+        max_armed: int = MAX_ARMED_PROFILES,
+    ):
+        self._lock = threading.Lock()
+        self._profiles: "OrderedDict[str, ProfileSession]" = OrderedDict()
+        self._max_profiles = max_profiles
+        self._max_armed = max_armed
+        self._armed = 0
+        self._shared = shared
+
+    @property
+    def shared(self) -> bool:
+        return self._shared is not None
+
+    def add(self, session: ProfileSession) -> None:
+        if self._shared is not None:
+            stored = StoredProfile.from_session(session)
+            self._shared.set(f"profile:data:{session.id}", stored._record, SHARED_PROFILE_TTL)
+            self._shared.set(f"profile:summary:{session.id}", stored.summary(), SHARED_PROFILE_TTL)
+            # Keep only the newest profiles, as in-process
+            summaries = sorted((summary for _, summary in self._shared.items("profile:summary:")),
+                               key=lambda p: p.get("started_at") or 0, reverse=True)
+            for old in summaries[self._max_profiles:]:
+                self._shared.delete(f"profile:data:{old['profile_id']}")
+                self._shared.delete(f"profile:summary:{old['profile_id']}")
+            return
+        with self._lock:
+            self._profiles[session.id] = session
+            while len(self._profiles) > self._max_profiles:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str):
+        """Return a `ProfileSession` (or a `StoredProfile` when shared), or None."""
+        if self._shared is not None:
+            record = self._shared.get(f"profile:data:{profile_id}")
+            return StoredProfile(record) if record is not None else None
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        if self._shared is not None:
+            summaries = [summary for _, summary in self._shared.items("profile:summary:")]
+            summaries.sort(key=lambda p: p.get("started_at") or 0, reverse=True)
+            return summaries[:self._max_profiles]
+        with self._lock:
+            return [s.summary() for s in reversed(self._profiles.values())]
+
+    def arm(self, count: int) -> int:
+        """Profile the next `count` pipeline runs; at most `max_armed` are armed at once."""
+        if self._shared is not None:
+            return self._shared.add_counter(self._ARMED_KEY, count, maximum=self._max_armed)
+        with self._lock:
+            self._armed = min(self._armed + count, self._max_armed)
+            return self._armed
+
+    def consume_armed(self) -> bool:
+        if self._shared is not None:
+            return self._shared.take_counter(self._ARMED_KEY)
+        with self._lock:
+            if self._armed > 0:
+                self._armed -= 1
+                return True
+            return False
+
+
+def profiling_enabled() -> bool:
+    """Profiling is only available when `PROFILE_ADMIN_TOKEN` is configured."""
+    return bool(PROFILE_ADMIN_TOKEN)
+
+
+def check_admin_token(token: Optional[str]) -> bool:
+    """Whether `token` grants access to profiling (never, if no token is configured)."""
+    if not PROFILE_ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+async def should_profile(headers: Dict[str, str]) -> bool:
+    """
+    Decide whether to profile a run from its (lower-cased) request headers.
+
+    An explicit `X-Profile` header wins; otherwise an armed slot is used.
+    Always False while profiling is disabled.
+    """
+    if not profiling_enabled():
+        return False
+    flag = headers.get("x-profile", "").strip().lower()
+    if flag in ("1", "true", "yes", "on"):
+        return check_admin_token(headers.get("x-admin-token"))
+    store = get_profile_store()
+    if store.shared:
+        return await asyncio.to_thread(store.consume_armed)
+    return store.consume_armed()
+
+
+@asynccontextmanager
+async def profile_session(label: str, enabled: bool = True):
+    """Profile the enclosed block; yields the session (or None when disabled)."""
+    if not enabled:
+        yield None
+        return
+    session = ProfileSession(label)
+    session.start()
+    try:
+        yield session
+    finally:
+        await asyncio.to_thread(session.stop)
+
+
+class LoopLagMonitor:
+    """Reports event loop stalls longer than `threshold` seconds, with the blocking stack."""
+
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD, interval: float = 0.05, max_events: int = 200):
+        self.threshold = threshold
+        self.interval = interval
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self.max_lag = 0.0
+        self._beat = time.monotonic()
+        self._captured: Optional[Tuple[float, List[str]]] = None  # (beat, stack)
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def ensure_started(self) -> None:
+        """Start monitoring the running event loop (no-op if already running)."""
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = loop.time() - expected
+                beat, self._beat = self._beat, time.monotonic()
+                if lag >= self.threshold:
+                    self._record(lag, beat)
+        finally:
+            self._stop.set()
+
+    def _watchdog(self) -> None:
+        # Check often enough to catch the loop while it is still blocked
+        period = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(period):
+            beat = self._beat
+            if time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            if self._captured is not None and self._captured[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured = (beat, format_stack(frame))
+
+    def _record(self, lag: float, beat: float) -> None:
+        captured = self._captured
+        stack = captured[1] if captured is not None and captured[0] == beat else []
+        self._captured = None
+        self.max_lag = max(self.max_lag, lag)
+        event = {"at": time.time(), "lag_ms": round(lag * 1000, 1), "stack": stack}
+        self.events.append(event)
+        where = stack[-1] if stack else "unknown location"
+        print(f"⚠️  Event loop blocked for {event['lag_ms']:.0f} ms at {where}")
+
+    def events_since(self, since: float) -> List[Dict[str, Any]]:
+        return [e for e in list(self.events) if e["at"] >= since]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": LOOP_LAG_MONITOR,
+            "running": self.running,
+            "threshold_ms": round(self.threshold * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stalls": len(self.events),
+            "recent": list(self.events)[-20:],
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles selected endpoints on request and starts
+    the loop lag monitor.
+
+    The profile covers the whole response, including a streamed body, and
+    its ID is returned in the `X-Profile-Id` response header.
+    """
+
+    def __init__(self, app, paths=("/run", "/run_sse"), methods=("POST",)):
+        self.app = app
+        self.paths = tuple(paths)
+        self.methods = tuple(methods)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if LOOP_LAG_MONITOR:
+            get_loop_monitor().ensure_started()
+        if scope["method"] not in self.methods or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        if not await should_profile(headers):
+            await self.app(scope, receive, send)
+            return
+
+        async with profile_session(f"{scope['method']} {scope['path']}") as session:
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-profile-id", session.id.encode())]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+_store: Optional[ProfileStore] = None
+_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_profile_store() -> ProfileStore:
+    """Return the process-wide profile store."""
+    global _store
+    if _store is None:
+        _store = ProfileStore(shared=get_shared_cache())
+    return _store
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    """Return the process-wide loop lag monitor."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    return _monitor
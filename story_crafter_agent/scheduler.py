@@ -0,0 +1,409 @@
+"""
+Pipeline Scheduler
+
+Admission control for long-running story pipelines.
+
+- At most `max_active` pipelines run at once; the rest wait in a queue.
+- The queue has two priorities. Interactive requests are served
+  `interactive_weight` times for every batch request, so batch work still
+  makes progress under sustained interactive load.
+- When the queue is full, new requests are rejected immediately with a
+  Retry-After estimate instead of piling up.
+- Individual stages (the storyteller, illustration and formatter agents, and
+  image generation) have their own concurrency limits. Agents built as
+  `StagedAgent` hold their stage's slot while they run, so conversational
+  turns only wait when they reach an expensive stage.
+- A pipeline is admitted when it reaches the storyteller (the `StagedAgent`
+  with `pipeline=True`) and holds its ticket until the formatter is done.
+  Conversational turns on `/run` and `/run_sse` pass `AdmissionMiddleware`,
+  which takes their priority from the `X-Priority` header and answers 429
+  right away while the queue is full. Story jobs admit their pipeline
+  themselves and run it under `holding(ticket)`.
+- Limits are totals for the server: with several worker processes
+  (`WEB_CONCURRENCY`) each process gets its share.
+- Queue depth, wait times and stage usage are reported by `stats()`.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncGenerator, Callable, Dict, Any, Optional, Deque, Iterator
+
+from google.adk.agents import Agent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+
+PRIORITIES = ("interactive", "batch")
+
+# Worker processes sharing the limits below (set by `serve.py`)
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY") or "1"))
+
+
+def _per_worker(total: int) -> int:
+    """This process's share of a server-wide limit (0 stays unlimited)."""
+    return max(1, math.ceil(total / WORKERS)) if total > 0 else 0
+
+
+MAX_ACTIVE_PIPELINES = _per_worker(int(os.getenv("MAX_ACTIVE_PIPELINES", "4")))
+MAX_QUEUED_PIPELINES = _per_worker(int(os.getenv("MAX_QUEUED_PIPELINES", "32")))
+STAGE_LIMITS = {
+    "story": _per_worker(int(os.getenv("STORY_CONCURRENCY", "4"))),
+    "illustration": _per_worker(int(os.getenv("ILLUSTRATION_CONCURRENCY", "4"))),
+    "formatting": _per_worker(int(os.getenv("FORMATTING_CONCURRENCY", "4"))),
+    "image": _per_worker(int(os.getenv("IMAGE_CONCURRENCY", "3"))),
+}
+
+# Priority of the request being served, and the pipeline ticket it holds
+_priority: ContextVar[str] = ContextVar("pipeline_priority", default="interactive")
+_ticket: ContextVar[Optional["Ticket"]] = ContextVar("pipeline_ticket", default=None)
+
+
+class QueueFullError(Exception):
+    """Raised when a pipeline cannot be queued; `retry_after` is in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Pipeline queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A queued or running pipeline."""
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self.admitted = asyncio.get_running_loop().create_future()
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.admitted_at if self.admitted_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class StageSlot:
+    """A held stage slot. `release()` may be called early and only counts once."""
+
+    def __init__(self, release: Optional[Callable[[], None]] = None):
+        self._release = release
+
+    def release(self) -> None:
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+
+class PipelineScheduler:
+    """Bounded, prioritized admission of pipeline runs within one process."""
+
+    def __init__(
+        self,
+        max_active: int = MAX_ACTIVE_PIPELINES,
+        max_queued: int = MAX_QUEUED_PIPELINES,
+        interactive_weight: int = 3,
+        stage_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.interactive_weight = interactive_weight
+        self._queues: Dict[str, Deque[Ticket]] = {p: deque() for p in PRIORITIES}
+        self._active = 0
+        self._interactive_streak = 0
+        self._avg_run_seconds = 120.0
+        self._waits: Dict[str, Deque[float]] = {p: deque(maxlen=500) for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._rejected = {p: 0 for p in PRIORITIES}
+        self._stage_limits = dict(STAGE_LIMITS if stage_limits is None else stage_limits)
+        self._stages: Dict[str, asyncio.Semaphore] = {}
+        self._stage_active: Dict[str, int] = {}
+        self._stage_waiting: Dict[str, int] = {}
+
+    # ------------------------------------------------------------------
+    # Pipeline admission
+    # ------------------------------------------------------------------
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def is_full(self) -> bool:
+        """Whether a new pipeline would be rejected."""
+        return self._active >= self.max_active and self.queued() >= self.max_queued
+
+    def reject(self, priority: str) -> QueueFullError:
+        """Count a rejected request and return the error to answer it with."""
+        self._rejected[priority] += 1
+        return QueueFullError(self.retry_after())
+
+    def retry_after(self) -> int:
+        """Estimated seconds until a new request could be admitted."""
+        backlog = self.queued() + 1
+        estimate = self._avg_run_seconds * backlog / max(1, self.max_active)
+        return int(min(600, max(1, math.ceil(estimate))))
+
+    def enqueue(self, priority: str = "interactive") -> Ticket:
+        """
+        Queue a pipeline run.
+
+        Raises:
+            ValueError: If the priority is unknown.
+            QueueFullError: If the queue is full.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r} (expected one of {PRIORITIES})")
+        if self.is_full():
+            raise self.reject(priority)
+        ticket = Ticket(priority)
+        self._queues[priority].append(ticket)
+        self._dispatch()
+        return ticket
+
+    async def wait(self, ticket: Ticket) -> None:
+        """Wait until the ticket is admitted. Cancelling removes it from the queue."""
+        try:
+            await asyncio.shield(ticket.admitted)
+        except asyncio.CancelledError:
+            if ticket.admitted.done():
+                self.release(ticket)
+            else:
+                ticket.admitted.cancel()
+                if ticket in self._queues[ticket.priority]:
+                    self._queues[ticket.priority].remove(ticket)
+            raise
+
+    def release(self, ticket: Ticket) -> None:
+        """Mark an admitted pipeline as finished and admit the next one."""
+        if ticket.admitted_at is None or ticket.released:
+            return
+        run_seconds = time.monotonic() - ticket.admitted_at
+        self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * run_seconds
+        ticket.released = True
+        self._active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def admit(self, priority: str = "interactive"):
+        """Queue, wait for admission and release around a pipeline run."""
+        ticket = self.enqueue(priority)
+        await self.wait(ticket)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        interactive, batch = self._queues["interactive"], self._queues["batch"]
+        if interactive and not batch:
+            self._interactive_streak = 0
+            return interactive.popleft()
+        if interactive and self._interactive_streak < self.interactive_weight:
+            self._interactive_streak += 1
+            return interactive.popleft()
+        if batch:
+            self._interactive_streak = 0
+            return batch.popleft()
+        return None
+
+    def _dispatch(self) -> None:
+        while self._active < self.max_active:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            if ticket.admitted.done():  # cancelled while queued
+                continue
+            ticket.admitted_at = time.monotonic()
+            self._waits[ticket.priority].append(ticket.wait_seconds)
+            self._admitted[ticket.priority] += 1
+            self._active += 1
+            ticket.admitted.set_result(None)
+
+    # ------------------------------------------------------------------
+    # Stage limits
+    # ------------------------------------------------------------------
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """
+        Hold one of the stage's slots; stages without a limit are unbounded.
+
+        Yields a `StageSlot` that can be released before the block ends.
+        """
+        limit = self._stage_limits.get(name)
+        if not limit:
+            yield StageSlot()
+            return
+        semaphore = self._stages.get(name)
+        if semaphore is None:
+            semaphore = self._stages[name] = asyncio.Semaphore(limit)
+        self._stage_waiting[name] = self._stage_waiting.get(name, 0) + 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._stage_waiting[name] -= 1
+        self._stage_active[name] = self._stage_active.get(name, 0) + 1
+
+        def _release() -> None:
+            self._stage_active[name] -= 1
+            semaphore.release()
+
+        slot = StageSlot(_release)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        def _percentile(values, q: float) -> Optional[float]:
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+        return {
+            "workers": WORKERS,
+            "active": self._active,
+            "max_active": self.max_active,
+            "queued": self.queued(),
+            "max_queued": self.max_queued,
+            "retry_after": self.retry_after(),
+            "avg_run_seconds": round(self._avg_run_seconds, 1),
+            "priorities": {
+                p: {
+                    "queued": len(self._queues[p]),
+                    "admitted": self._admitted[p],
+                    "rejected": self._rejected[p],
+                    "wait_p50": _percentile(self._waits[p], 0.5),
+                    "wait_p95": _percentile(self._waits[p], 0.95),
+                    "oldest_wait": round(self._queues[p][0].wait_seconds, 3) if self._queues[p] else 0.0,
+                }
+                for p in PRIORITIES
+            },
+            "stages": {
+                name: {
+                    "limit": limit,
+                    "active": self._stage_active.get(name, 0),
+                    "waiting": self._stage_waiting.get(name, 0),
+                }
+                for name, limit in self._stage_limits.items()
+            },
+        }
+
+
+@contextmanager
+def holding(ticket: Ticket) -> Iterator[None]:
+    """Run the enclosed pipeline under an already admitted ticket."""
+    token = _ticket.set(ticket)
+    try:
+        yield
+    finally:
+        _ticket.reset(token)
+
+
+class StagedAgent(Agent):
+    """
+    An agent whose runs hold a slot of a scheduler stage.
+
+    The slot is given back as soon as the agent transfers to the next agent
+    (which runs nested inside this one), so a stage only counts its own work.
+    With `pipeline`, the run is also admitted as a pipeline (unless it already
+    holds a ticket) and keeps the ticket until the agents it transferred to
+    are done.
+
+    Raises:
+        QueueFullError: If the pipeline cannot be queued.
+    """
+
+    stage: str
+    pipeline: bool = False
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        if not self.pipeline or _ticket.get() is not None:
+            async with aclosing(self._run_staged(ctx)) as events:
+                async for event in events:
+                    yield event
+            return
+        async with get_scheduler().admit(_priority.get()) as ticket:
+            with holding(ticket):
+                async with aclosing(self._run_staged(ctx)) as events:
+                    async for event in events:
+                        yield event
+
+    async def _run_staged(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        async with get_scheduler().stage(self.stage) as slot:
+            async with aclosing(super()._run_async_impl(ctx)) as events:
+                async for event in events:
+                    if event.actions and event.actions.transfer_to_agent:
+                        slot.release()
+                    yield event
+
+
+async def send_queue_full(send, error: QueueFullError) -> None:
+    """Answer an ASGI request with 429 and a Retry-After header."""
+    body = json.dumps({"detail": str(error), "retry_after": error.retry_after}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(error.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware for the conversational endpoints.
+
+    Requests run with the priority of their `X-Priority` header
+    (`interactive` by default), which the storyteller uses when it admits
+    the pipeline. While the queue is full they are answered with 429 and a
+    Retry-After header without touching the application. Turns that do not
+    reach the storyteller are not queued.
+    """
+
+    def __init__(self, app, paths=("/run", "/run_sse"), methods=("POST",)):
+        self.app = app
+        self.paths = tuple(paths)
+        self.methods = tuple(methods)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.methods or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        priority = headers.get(b"x-priority", b"interactive").decode("latin-1").strip().lower()
+        if priority not in PRIORITIES:
+            priority = "interactive"
+
+        scheduler = get_scheduler()
+        if scheduler.is_full():
+            await send_queue_full(send, scheduler.reject(priority))
+            return
+        token = _priority.set(priority)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _priority.reset(token)
+
+
+_scheduler: Optional[PipelineScheduler] = None
+
+
+def get_scheduler() -> PipelineScheduler:
+    """Return the process-wide scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = PipelineScheduler()
+    return _scheduler
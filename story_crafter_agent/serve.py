@@ -0,0 +1,110 @@
+"""
+Multi-worker server.
+
+Runs the FastAPI app under gunicorn with uvicorn workers, loading the app
+once in the master process before forking so workers share its memory
+(prompts, agents, imported modules) copy-on-write.
+
+Before the app is loaded, the master builds a memory-mapped snapshot of the
+read-only data (chapter indexes, digests, library metadata) and maps it, so
+every worker reads the same pages. Mutable state that any worker may be
+asked about is shared through SQLite files next to the snapshot: ADK
+sessions (`SESSION_SERVICE_URI`), and the library cache, story job progress
+and profiles (`SHARED_CACHE_PATH`). The directory is removed when the
+server exits.
+
+    python -m story_crafter_agent.serve --workers 4 --port 8086
+
+The pipeline scheduler limits (MAX_ACTIVE_PIPELINES, ...) are totals for
+the server; each worker enforces its share. Book prefetches are per worker.
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+from typing import List, Optional
+
+from gunicorn.app.base import BaseApplication
+
+from story_crafter_agent.shared_state import build_snapshot, open_snapshot
+
+
+class _PreforkApplication(BaseApplication):
+    def __init__(self, options: dict):
+        self._options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self._options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from story_crafter_agent.fast_api_app import app
+        return app
+
+
+def serve(
+    workers: Optional[int] = None,
+    host: str = "0.0.0.0",
+    port: int = 8086,
+    state_dir: Optional[str] = None,
+) -> None:
+    """
+    Serve the app with `workers` processes (default: one per CPU core).
+
+    Args:
+        workers: Number of worker processes.
+        host: Interface to bind.
+        port: Port to bind.
+        state_dir: Where to put the snapshot, shared cache and sessions
+            (default: /dev/shm when available, else the temp directory).
+    """
+    workers = workers or multiprocessing.cpu_count()
+    # The scheduler splits its limits between the workers
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if state_dir is None:
+        state_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    master_pid = os.getpid()
+    state_dir = os.path.join(state_dir, f"story_crafter_{master_pid}")
+    os.makedirs(state_dir, exist_ok=True)
+
+    try:
+        snapshot_path = build_snapshot(os.path.join(state_dir, "snapshot.bin"))
+        open_snapshot(snapshot_path)
+        os.environ["SHARED_SNAPSHOT"] = snapshot_path
+        os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(state_dir, "cache.db"))
+        os.environ.setdefault("SESSION_SERVICE_URI", f"sqlite:///{os.path.join(state_dir, 'sessions.db')}")
+        print(f"✓ Shared snapshot mapped: {snapshot_path}")
+        print(f"✓ Shared cache: {os.environ['SHARED_CACHE_PATH']}")
+        print(f"✓ Sessions: {os.environ['SESSION_SERVICE_URI']}")
+
+        _PreforkApplication({
+            "bind": f"{host}:{port}",
+            "workers": workers,
+            "worker_class": "uvicorn.workers.UvicornWorker",
+            "preload_app": True,
+            # Story pipelines hold requests open for minutes
+            "timeout": 0,
+            "graceful_timeout": 30,
+        }).run()
+    finally:
+        # Workers unwind through here too when they exit; only the master cleans up
+        if os.getpid() == master_pid:
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Story Crafter API with multiple worker processes.")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "0")) or None,
+                        help="Worker processes (default: WEB_CONCURRENCY or one per CPU core)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8086")))
+    parser.add_argument("--state-dir", default=None, help="Directory for the shared snapshot and cache")
+    args = parser.parse_args(argv)
+    serve(workers=args.workers, host=args.host, port=args.port, state_dir=args.state_dir)
+
+
+if __name__ == "__main__":
+    main()
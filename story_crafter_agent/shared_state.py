@@ -0,0 +1,265 @@
+"""
+Shared State
+
+Data shared between the worker processes of a multi-worker server.
+
+- `SharedSnapshot`: a read-only, memory-mapped file holding the book
+  chapter indexes, digests and library metadata. It is built once by the
+  master process and mapped before workers fork, so every worker reads the
+  same physical pages instead of holding its own copy. Each entry records
+  the modification times of the files it was built from; once those change
+  (a digest rebuilt, a book ingested) the entry is ignored and the data is
+  read from the files again.
+- `SharedCache`: a cross-process key/value cache with TTLs and counters,
+  backed by SQLite in WAL mode, for mutable state such as library API
+  responses, story job progress and completed profiles. Expired entries are
+  purged every `PURGE_EVERY` writes.
+
+Both are opt-in through environment variables set by `serve.py`
+(`SHARED_SNAPSHOT` and `SHARED_CACHE_PATH`); single-process runs keep using
+in-process caches.
+"""
+
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+_MAGIC = b"SCSNAP02"
+_HEADER = struct.Struct("<8sQ")
+
+# Writes to a SharedCache (per process) between purges of expired entries
+PURGE_EVERY = 500
+# The WAL file is truncated back to this size after checkpoints
+WAL_SIZE_LIMIT = 16 * 1024 * 1024
+
+
+def file_stamp(*paths) -> List[Optional[int]]:
+    """Modification times of `paths` (None for missing ones), to tell whether data built from them is current."""
+    stamp: List[Optional[int]] = []
+    for path in paths:
+        try:
+            stamp.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamp.append(None)
+    return stamp
+
+
+class SharedSnapshot:
+    """
+    Read-only key/value snapshot in a memory-mapped file.
+
+    Layout: magic, index length, JSON index of key -> [offset, length],
+    then the JSON-encoded values. Values are decoded on access, so only the
+    small index lives in each process's heap. Values are stored as
+    {"stamp", "value"}; read them with `get_fresh`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"Not a shared snapshot: {path}")
+        index_end = _HEADER.size + index_length
+        self._index: Dict[str, Tuple[int, int]] = json.loads(self._mm[_HEADER.size:index_end])
+        self._data_start = index_end
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str, default: Any = None) -> Any:
+        location = self._index.get(key)
+        if location is None:
+            return default
+        offset, length = location
+        start = self._data_start + offset
+        return json.loads(self._mm[start:start + length])
+
+    def get_fresh(self, key: str, stamp: List[Optional[int]]) -> Any:
+        """
+        Value of `key` if it was built from sources with the same `stamp`
+        (see `file_stamp`), else None.
+        """
+        entry = self.get(key)
+        if entry is None or entry["stamp"] != stamp:
+            return None
+        return entry["value"]
+
+    @staticmethod
+    def write(path: str, items: Iterable[Tuple[str, List[Optional[int]], Any]]) -> None:
+        """Write a snapshot atomically from (key, stamp, JSON-serializable value) triples."""
+        index: Dict[str, Tuple[int, int]] = {}
+        blobs = []
+        offset = 0
+        for key, stamp, value in items:
+            blob = json.dumps({"stamp": stamp, "value": value}, ensure_ascii=False).encode("utf-8")
+            index[key] = (offset, len(blob))
+            blobs.append(blob)
+            offset += len(blob)
+        index_blob = json.dumps(index).encode("utf-8")
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(index_blob)))
+            f.write(index_blob)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+
+
+def _snapshot_items():
+    """Everything read-only the request path needs, keyed for the snapshot."""
+    from story_crafter_agent.tools.book_text import BOOKS_DIR, chapter_index_stamp, get_chapter_index
+    from story_crafter_agent.tools.digest_tools import digest_stamp, load_digest
+    from story_crafter_agent.tools.library_backends import EmbeddedLibraryBackend
+
+    # Stamps are taken first: a file changing mid-build leaves its entry stale, never wrong
+    library = EmbeddedLibraryBackend()
+    stamp = library.stamp()
+    yield "library", stamp, library._load()
+    for file_path in sorted(BOOKS_DIR.glob("*.txt")):
+        book_id = file_path.stem
+        stamp = chapter_index_stamp(book_id)
+        yield f"chapters:{book_id}", stamp, get_chapter_index(book_id)
+        stamp = digest_stamp(book_id)
+        digest = load_digest(book_id)
+        if digest is not None:
+            yield f"digest:{book_id}", stamp, digest
+
+
+_snapshot: Optional[SharedSnapshot] = None
+_snapshot_loaded = False
+
+
+def build_snapshot(path: str) -> str:
+    """
+    Build the shared snapshot of chapter indexes, digests and library metadata.
+
+    The data is always read from the source files, never from a previously
+    opened snapshot.
+    """
+    global _snapshot, _snapshot_loaded
+    _snapshot, _snapshot_loaded = None, True
+    SharedSnapshot.write(path, _snapshot_items())
+    return path
+
+
+def open_snapshot(path: str) -> SharedSnapshot:
+    """Map a snapshot as this process's shared data (call before forking)."""
+    global _snapshot, _snapshot_loaded
+    _snapshot, _snapshot_loaded = SharedSnapshot(path), True
+    return _snapshot
+
+
+def get_snapshot() -> Optional[SharedSnapshot]:
+    """
+    Return the snapshot named by `SHARED_SNAPSHOT`, or None when not serving
+    in multi-worker mode. Call once before forking to share the mapping.
+    """
+    global _snapshot, _snapshot_loaded
+    if not _snapshot_loaded:
+        path = os.getenv("SHARED_SNAPSHOT")
+        if path and os.path.exists(path):
+            _snapshot = SharedSnapshot(path)
+        _snapshot_loaded = True
+    return _snapshot
+
+
+class SharedCache:
+    """Cross-process TTL cache of JSON-serializable values, stored in SQLite."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must not cross a fork, so they are keyed by process too
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA journal_size_limit={WAL_SIZE_LIMIT}")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl),
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            self.purge_expired()
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        """Unexpired (key, value) pairs whose key starts with `prefix`."""
+        rows = self._connect().execute(
+            "SELECT key, value FROM cache WHERE key >= ? AND key < ? AND expires_at > ?",
+            (prefix, prefix + "\uffff", time.time()),
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def purge_expired(self) -> int:
+        """Delete expired entries; returns how many."""
+        return self._connect().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def add_counter(self, key: str, delta: int, maximum: Optional[int] = None) -> int:
+        """Add `delta` to a counter (created at 0), capped at `maximum`, and return the new value."""
+        cap = maximum if maximum is not None else sys.maxsize
+        conn = self._connect()
+        conn.execute(
+            "INSERT INTO counters (key, value) VALUES (?, MIN(?, ?)) "
+            "ON CONFLICT(key) DO UPDATE SET value = MIN(value + ?, ?)",
+            (key, delta, cap, delta, cap),
+        )
+        return conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+
+    def take_counter(self, key: str) -> bool:
+        """Atomically decrement a positive counter; False if it was zero."""
+        return self._connect().execute(
+            "UPDATE counters SET value = value - 1 WHERE key = ? AND value > 0", (key,)
+        ).rowcount > 0
+
+
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache() -> Optional[SharedCache]:
+    """Return the cache at `SHARED_CACHE_PATH`, or None when not serving in multi-worker mode."""
+    global _shared_cache
+    path = os.getenv("SHARED_CACHE_PATH")
+    if not path:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None or _shared_cache.path != path:
+            _shared_cache = SharedCache(path)
+        return _shared_cache
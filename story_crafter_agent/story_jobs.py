@@ -0,0 +1,315 @@
+"""
+Story Jobs
+
+One-shot story generation without the conversational stages.
+
+A job takes a book ID and a complete personalization profile, seeds a fresh
+session with them and runs the pipeline from the StoryTellerAgent onwards
+(storytelling, illustration, formatting). Jobs run on their own copy of
+those agents, rooted at the StoryTellerAgent, so its transfers do not
+depend on the conversational root agent. Progress is recorded as a list of
+events that clients can poll or stream.
+
+A job runs in the worker that accepted it. In multi-worker mode its state
+and events are also written to the shared cache, so any worker can answer
+polls and event streams for it.
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from typing import List, Dict, Any, Optional
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from story_crafter_agent.profiling import profile_session
+from story_crafter_agent.scheduler import Ticket, get_scheduler, holding
+from story_crafter_agent.shared_state import get_shared_cache
+from story_crafter_agent.sub_agents.formatter_agent import formatter_agent
+from story_crafter_agent.sub_agents.illustration_agent import illustration_agent
+from story_crafter_agent.sub_agents.storyteller_agent import storyteller_agent
+from story_crafter_agent.tools.prefetch_tools import get_prefetcher
+
+APP_NAME = "story_crafter_jobs"
+
+# Finished jobs are kept this long for polling, then dropped
+JOB_RETENTION_SECONDS = 3600
+MAX_JOBS = 1000
+# How often a worker polls the shared cache when streaming another worker's job
+SHARED_POLL_SECONDS = 0.5
+
+_TERMINAL_STATES = ("completed", "failed")
+
+
+def _shared_key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+class StoryJob:
+    """State and progress events of one story generation job."""
+
+    def __init__(self, profile: Dict[str, Any], user_id: str, priority: str, ticket: Ticket, profiled: bool = False):
+        self.id = uuid.uuid4().hex
+        self.profile = profile
+        self.user_id = user_id
+        self.priority = priority
+        self.ticket = ticket
+        self.profiled = profiled
+        self.profile_id: Optional[str] = None
+        self.session_id: Optional[str] = None
+        self.state = "queued"
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Condition()
+
+    async def emit(self, kind: str, **data: Any) -> None:
+        """Record a progress event and wake up streaming clients."""
+        async with self._changed:
+            self.events.append({"seq": len(self.events), "type": kind, "time": time.time(), **data})
+            self._changed.notify_all()
+        await self.publish()
+
+    async def publish(self) -> None:
+        """Write the job's state and events to the shared cache (multi-worker mode only)."""
+        cache = get_shared_cache()
+        if cache is None:
+            return
+        record = {**self.to_dict(), "event_log": list(self.events)}
+        try:
+            await asyncio.to_thread(cache.set, _shared_key(self.id), record, JOB_RETENTION_SECONDS)
+        except Exception as e:
+            print(f"⚠️  Could not publish job {self.id}: {e}")
+
+    async def stream(self, after: int = 0):
+        """Yield events from `after` onwards until the job finishes."""
+        position = after
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: len(self.events) > position or self.state in _TERMINAL_STATES
+                )
+                pending = self.events[position:]
+                finished = self.state in _TERMINAL_STATES
+            for event in pending:
+                yield event
+            position += len(pending)
+            if finished and position >= len(self.events):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "profile": self.profile,
+            "priority": self.priority,
+            "queue_wait_seconds": round(self.ticket.wait_seconds, 3),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+            "events": len(self.events),
+            "profile_id": self.profile_id,
+        }
+
+
+class SharedJob:
+    """Read-only view of a job running in another worker, read from the shared cache."""
+
+    def __init__(self, job_id: str, record: Dict[str, Any]):
+        self.id = job_id
+        self._record = record
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in self._record.items() if k != "event_log"}
+
+    async def stream(self, after: int = 0):
+        """Yield events from `after` onwards, polling until the job finishes."""
+        cache = get_shared_cache()
+        position = after
+        record: Optional[Dict[str, Any]] = self._record
+        while record is not None:
+            events = record["event_log"]
+            for event in events[position:]:
+                yield event
+            position = max(position, len(events))
+            if record["state"] in _TERMINAL_STATES:
+                return
+            await asyncio.sleep(SHARED_POLL_SECONDS)
+            record = await asyncio.to_thread(cache.get, _shared_key(self.id))
+
+
+def _profile_message(profile: Dict[str, Any]) -> str:
+    """Render the profile as the confirmed `submit_personalization_profile` output."""
+    confirmed = {**profile, "status": "confirmed"}
+    return (
+        "The personalization interview is complete. `submit_personalization_profile` returned:\n\n"
+        f"```json\n{json.dumps(confirmed, indent=2)}\n```\n\n"
+        "Generate the story for this profile now."
+    )
+
+
+def build_pipeline_agent():
+    """A copy of the StoryTellerAgent with the stages it transfers to as sub-agents."""
+    return storyteller_agent.clone(
+        update={"sub_agents": [illustration_agent.clone(), formatter_agent.clone()]}
+    )
+
+
+class StoryJobManager:
+    """Creates, runs and tracks story jobs in this process."""
+
+    def __init__(self):
+        self._session_service = InMemorySessionService()
+        self._runner = Runner(
+            app_name=APP_NAME,
+            agent=build_pipeline_agent(),
+            session_service=self._session_service,
+        )
+        self._jobs: Dict[str, StoryJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def get(self, job_id: str):
+        """Return a job of this worker, or a `SharedJob` view of another worker's job."""
+        job = self._jobs.get(job_id)
+        cache = get_shared_cache()
+        if job is not None or cache is None:
+            return job
+        record = await asyncio.to_thread(cache.get, _shared_key(job_id))
+        return SharedJob(job_id, record) if record is not None else None
+
+    async def submit(
+        self,
+        profile: Dict[str, Any],
+        user_id: str = "api",
+        priority: str = "interactive",
+        profiled: bool = False,
+    ) -> StoryJob:
+        """
+        Queue a job and start running it in the background once admitted.
+
+        With `profiled`, the run (excluding the queue wait) is profiled and
+        the profile ID is reported in the job.
+
+        Raises:
+            QueueFullError: If the scheduler queue is full.
+        """
+        self._evict()
+        ticket = get_scheduler().enqueue(priority)
+        job = StoryJob(profile, user_id, priority, ticket, profiled=profiled)
+        self._jobs[job.id] = job
+        # Book assets load while the session is being set up
+        get_prefetcher().start(profile["book_id"], owner=job.id)
+        # Published before the run starts, so its events are never overwritten
+        try:
+            await job.publish()
+        finally:
+            self._tasks[job.id] = asyncio.create_task(self._run(job))
+        return job
+
+    def _evict(self) -> None:
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at and now - job.finished_at > JOB_RETENTION_SECONDS:
+                del self._jobs[job_id]
+        while len(self._jobs) >= MAX_JOBS:
+            oldest = min(
+                (j for j in self._jobs.values() if j.state in _TERMINAL_STATES),
+                key=lambda j: j.created_at,
+                default=None,
+            )
+            if oldest is None:
+                break
+            del self._jobs[oldest.id]
+
+    async def _run(self, job: StoryJob) -> None:
+        scheduler = get_scheduler()
+        try:
+            await job.emit("queued", priority=job.priority, queued=scheduler.queued())
+            await scheduler.wait(job.ticket)
+            job.state = "running"
+            await job.emit("started", stage=storyteller_agent.name, queue_wait_seconds=round(job.ticket.wait_seconds, 3))
+            async with profile_session(f"story job {job.id}", enabled=job.profiled) as profiling:
+                if profiling is not None:
+                    job.profile_id = profiling.id
+                with holding(job.ticket):
+                    await self._run_pipeline(job)
+
+            job.state = "completed" if job.result.get("story_text") else "failed"
+            if job.state == "failed":
+                job.error = "The pipeline finished without submitting a story"
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+        finally:
+            scheduler.release(job.ticket)
+            get_prefetcher().release(job.profile["book_id"], owner=job.id)
+            # The results are copied into the job, so the session is not needed anymore
+            await self._delete_session(job)
+            job.finished_at = time.time()
+            self._tasks.pop(job.id, None)
+            await job.emit(job.state, error=job.error)
+
+    async def _delete_session(self, job: StoryJob) -> None:
+        if job.session_id is None:
+            return
+        try:
+            await self._session_service.delete_session(
+                app_name=APP_NAME, user_id=job.user_id, session_id=job.session_id
+            )
+        except Exception as e:
+            print(f"⚠️  Could not delete session of job {job.id}: {e}")
+        job.session_id = None
+
+    async def _run_pipeline(self, job: StoryJob) -> None:
+        session = await self._session_service.create_session(
+            app_name=APP_NAME,
+            user_id=job.user_id,
+            state={"selected_book_id": job.profile["book_id"], "personalization_profile": job.profile},
+        )
+        job.session_id = session.id
+        message = types.Content(role="user", parts=[types.Part(text=_profile_message(job.profile))])
+
+        stage = storyteller_agent.name
+        async for event in self._runner.run_async(
+            user_id=job.user_id, session_id=session.id, new_message=message
+        ):
+            if event.author and event.author not in ("user", stage):
+                stage = event.author
+                await job.emit("stage", stage=stage)
+            for call in event.get_function_calls():
+                await job.emit("tool_call", stage=stage, tool=call.name)
+            for response in event.get_function_responses():
+                self._collect_result(job, response.name, response.response)
+                await job.emit("tool_result", stage=stage, tool=response.name)
+
+    @staticmethod
+    def _collect_result(job: StoryJob, tool: str, response: Optional[Dict[str, Any]]) -> None:
+        if not response:
+            return
+        if tool in ("submit_story_with_prompts", "repair_story_parts"):
+            if "story_text" not in response:
+                return
+            job.result["story_text"] = response.get("story_text")
+            job.result["image_prompts"] = response.get("image_prompts")
+            job.result["quality"] = response.get("quality")
+        elif tool == "generate_image":
+            job.result.setdefault("images", []).append(response.get("result"))
+        elif tool == "save_formatted_story":
+            job.result["output_path"] = response.get("result")
+
+
+_manager: Optional[StoryJobManager] = None
+
+
+def get_job_manager() -> StoryJobManager:
+    """Return the process-wide job manager."""
+    global _manager
+    if _manager is None:
+        _manager = StoryJobManager()
+    return _manager
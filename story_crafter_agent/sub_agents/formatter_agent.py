@@ -8,8 +8,8 @@ Transforms raw story with image anchors into a polished, book-like illustrated s
 """
 
 from pathlib import Path
-from google.adk.agents import Agent
 from story_crafter_agent.tools.formatting_tools import save_formatted_story
+from story_crafter_agent.scheduler import StagedAgent
 
 
 def _load_prompt_file(filename: str) -> str:
@@ -21,7 +21,8 @@ def _load_prompt_file(filename: str) -> str:
         return f.read().strip()
 
 
-formatter_agent = Agent(
+formatter_agent = StagedAgent(
+    stage="formatting",
     name="FormatterAgent",
     model="gemini-2.5-pro",
     instruction=_load_prompt_file("formatter_agent.md"),
@@ -1,8 +1,9 @@
-from google.adk.agents import Agent
 from story_crafter_agent.tools.image_generation_tools import generate_image
 from google.adk.tools import transfer_to_agent
+from story_crafter_agent.scheduler import StagedAgent
 
-illustration_agent = Agent(
+illustration_agent = StagedAgent(
+    stage="illustration",
     name="IllustrationAgent",
     model="gemini-2.5-pro",
     instruction="""
@@ -20,6 +21,7 @@ illustration_agent = Agent(
     ### Step 1: Extract Data
     Scan conversation history to find:
     - `submit_story_with_prompts` output: contains `story_text` and `image_prompts`
+      (if `repair_story_parts` was called afterwards, use its latest output instead)
     - `submit_personalization_profile` output: contains `book_id`
     - `get_book_details` output: contains `title` (use as book_title)
     
@@ -30,7 +32,8 @@ illustration_agent = Agent(
     Select the 6 most important/dramatic scenes from the image_prompts dictionary.
     
     For EACH selected prompt:
-    - Call `generate_image(prompt=<prompt_text>)` ONCE
+    - Call `generate_image(prompt=<prompt_text>, anchor="IMAGE_X")` ONCE
+      (after a repair, unchanged anchors return their existing image instantly)
     - If successful: collect the returned file path and map IMAGE_X -> path
     - If it fails: **skip immediately**, don't retry, move to next image
     - **If you get 2 consecutive failures, STOP generating and go to Step 3**
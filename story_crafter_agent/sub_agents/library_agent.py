@@ -1,5 +1,6 @@
 from google.adk.agents import Agent
 from story_crafter_agent.tools.library_tools import list_available_books, get_book_details, get_book_characters
+from story_crafter_agent.tools.prefetch_tools import confirm_book_selection
 
 library_agent = Agent(
     name="LibraryAgent",
@@ -16,9 +17,9 @@ library_agent = Agent(
     Present books with their Title, Author, and Genre.
     
     If the user selects a book:
-    1. Confirm the selection.
+    1. Call `confirm_book_selection` with the book ID. This starts preparing the book in the background.
     2. Provide a brief overview to ensure it's the one they want.
     3. Tell the user you are handing them over to the Personalization Agent to customize their story.
     """,
-    tools=[list_available_books, get_book_details, get_book_characters]
+    tools=[list_available_books, get_book_details, get_book_characters, confirm_book_selection]
 )
@@ -1,5 +1,6 @@
 from google.adk.agents import Agent
 from story_crafter_agent.tools.personalization_tools import submit_personalization_profile
+from story_crafter_agent.tools.prefetch_tools import confirm_book_selection
 
 personalization_agent = Agent(
     name="PersonalizationAgent",
@@ -15,6 +16,8 @@ personalization_agent = Agent(
     
     **IMPORTANT**: Before starting the interview, scan the conversation history to find which book was selected by the LibraryAgent. 
     Look for the book ID (e.g., "2701", "1342", etc.) that was discussed. Store this for later.
+    As soon as you know the book ID, call `confirm_book_selection` with it (once, before your first question)
+    so the book is prepared while you interview the user.
     
     Strategy:
     - Ask one or two questions at a time. Don't overwhelm the user.
@@ -27,5 +30,5 @@ personalization_agent = Agent(
     2. **Do NOT output the JSON as text.** Only use the tool.
     3. After the tool executes, **YOU MUST call the `transfer_to_agent` tool** with `agent_name='StoryTellerAgent'` to hand over control.
     """,
-    tools=[submit_personalization_profile]
+    tools=[confirm_book_selection, submit_personalization_profile]
 )
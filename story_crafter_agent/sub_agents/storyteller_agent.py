@@ -8,10 +8,12 @@ Generates personalized story adaptations of classic literature with illustration
 """
 
 from pathlib import Path
-from google.adk.agents import Agent
 from google.adk.tools import transfer_to_agent
 from story_crafter_agent.tools.library_tools import get_book_details
 from story_crafter_agent.tools.storyteller_tools import submit_story_with_prompts
+from story_crafter_agent.tools.digest_tools import get_book_digest
+from story_crafter_agent.tools.repair_tools import repair_story_parts
+from story_crafter_agent.scheduler import StagedAgent
 
 
 def _load_prompt_file(filename: str) -> str:
@@ -23,10 +25,12 @@ def _load_prompt_file(filename: str) -> str:
         return f.read().strip()
 
 
-storyteller_agent = Agent(
+storyteller_agent = StagedAgent(
+    stage="story",
+    pipeline=True,
     name="StoryTellerAgent",
     model="gemini-2.5-pro",
     instruction=_load_prompt_file("storyteller_agent.md"),
-    tools=[get_book_details, submit_story_with_prompts, transfer_to_agent],
+    tools=[get_book_details, get_book_digest, submit_story_with_prompts, repair_story_parts, transfer_to_agent],
     description="Generates personalized illustrated story adaptations from classic literature"
 )
@@ -0,0 +1,109 @@
+"""Tests for the artifact catalog: image dedup, reference counts, GC and reindexing."""
+
+import os
+
+import pytest
+
+from story_crafter_agent.artifact_catalog import ArtifactCatalog, image_filenames
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    return ArtifactCatalog(str(tmp_path / "artifacts.db"))
+
+
+def _image(directory, name: str, data: bytes = b"png-bytes") -> str:
+    path = directory / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def _story(directory, name: str, *images: str) -> tuple:
+    markdown = "# Story\n\n" + "\n\n".join(f"![{i}](generated_images/{i})" for i in images)
+    path = directory / name
+    path.write_text(markdown)
+    return str(path), markdown
+
+
+def _refcount(catalog: ArtifactCatalog, filename: str) -> int:
+    row = catalog._connect().execute("SELECT refcount FROM images WHERE filename = ?", (filename,)).fetchone()
+    return row["refcount"]
+
+
+def test_image_filenames():
+    markdown = '![a](../generated_images/a.png) <img alt="b" src="/x/generated_images/b.png"> ![a](a.png)'
+    assert image_filenames(markdown) == ["a.png", "b.png"]
+
+
+def test_identical_images_are_deduplicated(catalog, tmp_path):
+    first = _image(tmp_path, "first.png")
+    second = _image(tmp_path, "second.png")
+    kept = _image(tmp_path, "kept.png")
+
+    assert catalog.record_image(first, prompt="A boat") == first
+    assert catalog.record_image(second) == first
+    assert not os.path.exists(second)
+    # Files that stories may already embed are kept as aliases
+    assert catalog.record_image(kept, keep_duplicate=True) == kept
+    assert os.path.exists(kept)
+    assert catalog.stats()["images"] == 1
+
+
+def test_stories_take_and_drop_image_references(catalog, tmp_path):
+    catalog.record_image(_image(tmp_path, "a.png"))
+    one = _story(tmp_path, "one.md", "a.png")
+    two = _story(tmp_path, "two.md", "a.png")
+
+    catalog.record_story(*one, book_id="1268", user_id="alice")
+    catalog.record_story(*two)
+    assert _refcount(catalog, "a.png") == 2
+    # Re-saving a story replaces its record instead of adding a reference
+    catalog.record_story(*one)
+    assert _refcount(catalog, "a.png") == 2
+
+    with catalog._connect() as conn:
+        conn.execute("UPDATE stories SET created_at = 0 WHERE path = ?", (one[0],))
+    assert catalog.collect_garbage(retention_days=1)["stories"] == 1
+    assert not os.path.exists(one[0])
+    assert _refcount(catalog, "a.png") == 1
+    assert [s["path"] for s in catalog.list_stories()] == [two[0]]
+
+
+def test_gc_keeps_recent_and_referenced_images(catalog, tmp_path):
+    orphan = _image(tmp_path, "orphan.png", b"orphan")
+    used = _image(tmp_path, "used.png", b"used")
+    catalog.record_image(orphan)
+    catalog.record_image(used)
+    catalog.record_story(*_story(tmp_path, "story.md", "used.png"))
+
+    # Within the grace period an unreferenced image may belong to a story being formatted
+    assert catalog.collect_garbage()["images"] == 0
+    with catalog._connect() as conn:
+        conn.execute("UPDATE images SET created_at = created_at - 7 * 3600")
+    assert catalog.collect_garbage(dry_run=True)["images"] == 1
+    assert os.path.exists(orphan)
+
+    assert catalog.collect_garbage()["images"] == 1
+    assert not os.path.exists(orphan)
+    assert os.path.exists(used)
+    assert catalog.stats()["unreferenced_images"] == 0
+
+
+def test_reindex_catalogs_existing_files_without_deleting(catalog, tmp_path):
+    images_dir = tmp_path / "generated_images"
+    stories_dir = tmp_path / "output_stories"
+    images_dir.mkdir()
+    stories_dir.mkdir()
+    _image(images_dir, "a.png")
+    _image(images_dir, "copy_of_a.png")
+    _story(stories_dir, "1268_The_Island.md", "copy_of_a.png")
+
+    added = catalog.reindex(str(stories_dir), str(images_dir))
+    assert added == {"images": 2, "stories": 1}
+    assert sorted(p.name for p in images_dir.iterdir()) == ["a.png", "copy_of_a.png"]
+    [story] = catalog.list_stories()
+    assert story["book_id"] == "1268"
+    assert len(story["images"]) == 1
+    assert catalog.stats()["unreferenced_images"] == 0
+
+    assert catalog.reindex(str(stories_dir), str(images_dir)) == {"images": 0, "stories": 0}
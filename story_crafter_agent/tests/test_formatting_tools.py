@@ -0,0 +1,26 @@
+"""Tests for saving formatted stories."""
+
+import asyncio
+from types import SimpleNamespace
+
+from story_crafter_agent.artifact_catalog import ArtifactCatalog
+from story_crafter_agent.tools import formatting_tools
+from story_crafter_agent.tools.formatting_tools import save_formatted_story
+
+
+def test_saved_story_is_recorded_with_its_owner(tmp_path, monkeypatch):
+    catalog = ArtifactCatalog(str(tmp_path / "artifacts.db"))
+    monkeypatch.setattr(formatting_tools, "get_artifact_catalog", lambda: catalog)
+    monkeypatch.chdir(tmp_path)
+    tool_context = SimpleNamespace(
+        state={"selected_book_id": "2701", "personalization_profile": {"audience": "Adult"}},
+        session=SimpleNamespace(user_id="alice"),
+    )
+
+    path = asyncio.run(save_formatted_story("# The Harbor\n\nThe boat drifted.", tool_context=tool_context))
+
+    [story] = catalog.list_stories(user_id="alice")
+    assert story["path"] == path
+    assert story["book_id"] == "2701"
+    assert story["profile"] == {"audience": "Adult"}
+    assert catalog.list_stories(user_id="bob") == []
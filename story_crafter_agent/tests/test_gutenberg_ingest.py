@@ -0,0 +1,105 @@
+"""Tests for Gutenberg ingestion into the local library."""
+
+import pytest
+import zstandard
+
+from story_crafter_agent.tools import gutenberg_ingest
+from story_crafter_agent.tools.book_text import split_chapters, strip_gutenberg_boilerplate
+from story_crafter_agent.tools.gutenberg_ingest import (
+    book_archive_path,
+    edition_key,
+    ingest,
+    load_book_index,
+    load_catalog,
+    read_book,
+)
+
+BODY = (
+    "A NOTE ON THE TEXT\n\nThis edition follows the first printing.\n\n"
+    "CHAPTER I. The Wreck\n\nThe balloon fell towards the sea.\n\n"
+    "CHAPTER II. The Island\n\nThey climbed the granite cliffs.\n\n"
+    "CHAPTER III.\n\nFire\n\nA single match was left."
+)
+
+
+def _gutenberg(number: int, title: str, body: str = BODY, author: str = "Jules Verne") -> str:
+    return (
+        f"Title: {title}\nAuthor: {author}\nLanguage: English\n\n[EBook #{number}]\n\n"
+        f"*** START OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***\n\n"
+        f"{body}\n\n*** END OF THE PROJECT GUTENBERG EBOOK {title.upper()} ***\n"
+    )
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """Point the library at a temporary directory (worker processes are forked and inherit it)."""
+    library_dir = tmp_path / "library"
+    monkeypatch.setattr(gutenberg_ingest, "LIBRARY_DIR", library_dir)
+    monkeypatch.setattr(gutenberg_ingest, "CATALOG_PATH", library_dir / "catalog.json")
+    monkeypatch.setattr(gutenberg_ingest, "STAGING_DIR", library_dir / "staging")
+    monkeypatch.setattr(gutenberg_ingest, "_index_cache", {})
+    source = tmp_path / "source"
+    source.mkdir()
+    return source
+
+
+def test_frames_round_trip_to_the_original_body(library):
+    (library / "pg90001.txt").write_text("﻿" + _gutenberg(90001, "The Mysterious Island").replace("\n", "\r\n"))
+
+    summary = ingest(library, workers=1)
+
+    assert summary["ingested"] == 1
+    assert summary["failed"] == 0
+    body = strip_gutenberg_boilerplate(_gutenberg(90001, "The Mysterious Island"))
+    assert read_book("90001") == body
+    entry = load_catalog()["90001"]
+    assert (entry["title"], entry["author"], entry["language"]) == ("The Mysterious Island", "Jules Verne", "English")
+    assert entry["chapter_count"] == 4
+
+
+def test_chapter_frames_match_split_chapters(library):
+    (library / "90001.txt").write_text(_gutenberg(90001, "The Mysterious Island"))
+    ingest(library, workers=1)
+
+    body = read_book("90001")
+    chapters = split_chapters(body)
+    index = load_book_index("90001")["chapters"]
+    assert [(c["index"], c["number"], c["title"]) for c in index] == \
+        [(c["index"], c["number"], c["title"]) for c in chapters]
+    assert [c["title"] for c in chapters] == ["Front matter", "The Wreck", "The Island", "Fire"]
+
+    data = book_archive_path("90001").read_bytes()
+    for frame, chapter in zip(index, chapters):
+        text = zstandard.ZstdDecompressor().decompress(data[frame["offset"]:frame["offset"] + frame["length"]])
+        assert text.decode("utf-8") == body[chapter["start"]:chapter["end"]]
+
+
+def test_identical_texts_keep_the_lowest_ebook_number(library):
+    # Same body under different titles: only the content hash matches
+    (library / "90002.txt").write_text(_gutenberg(90002, "L'Île mystérieuse"))
+    (library / "90001.txt").write_text(_gutenberg(90001, "The Mysterious Island"))
+
+    summary = ingest(library, workers=1)
+
+    assert summary["duplicates_removed"] == 1
+    assert list(load_catalog()) == ["90001"]
+
+
+def test_editions_of_a_work_keep_the_most_complete_text(library):
+    (library / "90001.txt").write_text(_gutenberg(90001, "The Mysterious Island", BODY[:200]))
+    (library / "90002.txt").write_text(_gutenberg(90002, "Mysterious Island", BODY))
+    (library / "90003.txt").write_text(_gutenberg(90003, "Mysterious Island", BODY + "\n\nTHE END", author="Someone Else"))
+
+    summary = ingest(library, workers=1)
+
+    assert summary["duplicates_removed"] == 1
+    assert sorted(load_catalog()) == ["90002", "90003"]
+    with pytest.raises(KeyError):
+        load_book_index("90001")
+    assert not list((library.parent / "library" / "books").glob("90001-*"))
+
+
+def test_edition_key_ignores_articles_case_and_punctuation():
+    first = {"title": "The Mysterious Island!", "author": "Verne, Jules", "language": "English"}
+    second = {"title": "mysterious island", "author": "Verne Jules", "language": "english"}
+    assert edition_key(first) == edition_key(second)
@@ -0,0 +1,138 @@
+"""Tests for the deterministic story quality gate."""
+
+from story_crafter_agent.tools.quality_tools import (
+    MAX_IMAGES,
+    _features,
+    normalize_audience,
+    score_parts,
+    score_stories,
+    score_story,
+)
+
+SENTENCE = (
+    "The weathered fishing boat drifted slowly across the quiet harbor "
+    "while the exhausted sailors watched the distant lighthouse flicker."
+)
+SENTENCE_WORDS = len(SENTENCE.split())
+
+
+def _part(number: int, words: int, anchors=(), title: str = "A Part") -> str:
+    sentences = " ".join([SENTENCE] * max(1, words // SENTENCE_WORDS))
+    anchor_lines = "".join(f"\n\n[{a}]" for a in anchors)
+    return f"## Part {number}: {title}\n\n{sentences}{anchor_lines}\n\n"
+
+
+def _story(*parts: str) -> str:
+    return "# The Harbor\n\n" + "".join(parts)
+
+
+def _checks(report, severity="error"):
+    return {issue["check"] for issue in report["issues"] if issue["severity"] == severity}
+
+
+def test_sentences_end_before_closing_quotes_and_brackets():
+    text = 'He said, "Stop." She asked, “Why?” (They left!) [Done.] It rained.'
+    assert _features(text, {})["sentences"] == 5
+
+
+def test_curly_apostrophe_does_not_split_words():
+    assert _features("Don’t stop, it’s fine", {})["words"] == 4
+    assert _features("Don't stop, it's fine", {})["words"] == 4
+
+
+def test_normalize_audience():
+    assert normalize_audience("Children (5-8)") == "child"
+    assert normalize_audience("Young Adult") == "teen"
+    assert normalize_audience(None) == "adult"
+
+
+def test_well_formed_medium_story_passes():
+    story = _story(
+        _part(1, 300, ["IMAGE_1"]),
+        _part(2, 300, ["IMAGE_2"]),
+        _part(3, 300, ["IMAGE_3"]),
+        _part(4, 300, ["IMAGE_4"]),
+    )
+    prompts = {f"IMAGE_{i}": "A boat at dawn" for i in range(1, 5)}
+    report = score_story(story, prompts, "Medium", "Adult")
+    assert report["passed"], report["issues"]
+    assert report["metrics"]["images"] == 4
+    assert report["metrics"]["parts"] == 4
+    assert 1000 <= report["metrics"]["words"] <= 1500
+
+
+def test_short_story_fails_length():
+    story = _story(_part(1, 200, ["IMAGE_1"]), _part(2, 200, ["IMAGE_2"]))
+    report = score_story(story, {"IMAGE_1": "x", "IMAGE_2": "y"}, "Medium", "Adult")
+    assert not report["passed"]
+    assert "length" in _checks(report)
+
+
+def test_anchor_problems():
+    story = _story(_part(1, 600, ["IMAGE_1", "IMAGE_2"]), _part(2, 600, ["IMAGE_2"]))
+    report = score_story(story, {"[IMAGE_1]": "x", "IMAGE_3": "z"}, "Medium", "Adult")
+    messages = " ".join(issue["message"] for issue in report["issues"])
+    assert "Anchors without a prompt: IMAGE_2" in messages
+    assert "Anchors used more than once: IMAGE_2" in messages
+    assert "Prompts without an anchor: IMAGE_3" in messages
+    assert not report["passed"]
+
+
+def test_too_many_images():
+    anchors = [f"IMAGE_{i}" for i in range(1, MAX_IMAGES + 2)]
+    story = _story(_part(1, 1200, anchors))
+    report = score_story(story, {a: "x" for a in anchors}, "Medium", "Adult")
+    assert "image_count" in _checks(report)
+
+
+def test_chapter_labels_fail_structure():
+    story = "# The Harbor\n\n## Chapter 1\n\n" + " ".join([SENTENCE] * 100) + "\n\n[IMAGE_1]\n"
+    report = score_story(story, {"IMAGE_1": "x"}, "Medium", "Adult")
+    assert "structure" in _checks(report)
+
+
+def test_chapter_label_lines_are_counted():
+    text = "Chapter IV: The Storm\nCHAPTER 2\nChapter One \u2014 Home\n### chapter the last"
+    assert _features(text, {})["chapter_labels"] == 4
+
+
+def test_chapter_in_prose_is_not_a_label():
+    text = "She opened to the chapter I had marked.\nChapter I had marked was gone. In Chapter 3 they sail."
+    assert _features(text, {})["chapter_labels"] == 0
+
+
+def test_score_stories_batches_and_broadcasts():
+    good = _story(*(_part(i, 300, [f"IMAGE_{i}"]) for i in range(1, 5)))
+    prompts = {f"IMAGE_{i}": "x" for i in range(1, 5)}
+    reports = score_stories([good, "no parts here."], [prompts, None], "Medium", ["Adult", "Child"])
+    assert len(reports) == 2
+    assert reports[0]["passed"]
+    assert not reports[1]["passed"]
+    assert reports[0]["score"] > reports[1]["score"]
+    assert reports[1]["metrics"]["audience"] == "child"
+    assert score_stories([], []) == []
+
+
+def test_score_parts_blames_only_the_failing_part():
+    story = _story(
+        _part(1, 330, ["IMAGE_1"], "Calm"),
+        _part(2, 55, ["IMAGE_2"], "Storm"),
+        _part(3, 330, ["IMAGE_3"], "Home"),
+    )
+    reports = score_parts(story, {f"IMAGE_{i}": "x" for i in range(1, 4)}, "Medium", "Adult")
+    assert [r["number"] for r in reports] == [1, 2, 3]
+    assert [r["passed"] for r in reports] == [True, False, True]
+    assert reports[1]["title"] == "Storm"
+    assert {issue["check"] for issue in reports[1]["issues"]} == {"length"}
+    assert reports[0]["target_words"] == [333, 500]
+
+
+def test_score_parts_flags_anchor_shared_between_parts():
+    story = _story(_part(1, 550, ["IMAGE_1"]), _part(2, 550, ["IMAGE_1"]))
+    reports = score_parts(story, {"IMAGE_1": "x"}, "Medium", "Adult")
+    assert not any(r["passed"] for r in reports)
+    assert all("anchors" in {i["check"] for i in r["issues"]} for r in reports)
+
+
+def test_score_parts_without_parts():
+    assert score_parts("# Title\n\nJust prose.", {}) == []
@@ -0,0 +1,115 @@
+"""Tests for pipeline admission and stage limits."""
+
+import asyncio
+
+import pytest
+
+from story_crafter_agent import scheduler as scheduler_module
+from story_crafter_agent.scheduler import AdmissionMiddleware, PipelineScheduler, QueueFullError
+
+
+def test_dispatch_by_priority_with_batch_share():
+    async def run():
+        scheduler = PipelineScheduler(max_active=1, max_queued=10, interactive_weight=2, stage_limits={})
+        running = scheduler.enqueue("batch")
+        queued = [(name, scheduler.enqueue("interactive" if name.startswith("i") else "batch"))
+                  for name in ("b1", "b2", "i1", "i2", "i3")]
+        order = []
+        for _ in queued:
+            scheduler.release(running)
+            running = next(t for _, t in queued if t.admitted.done() and not t.released)
+            order.append(next(name for name, t in queued if t is running))
+        return order, scheduler.stats()
+
+    order, stats = asyncio.run(run())
+    assert order == ["i1", "i2", "b1", "i3", "b2"]
+    assert stats["priorities"]["interactive"]["admitted"] == 3
+    assert stats["priorities"]["batch"]["admitted"] == 3
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def run():
+        scheduler = PipelineScheduler(max_active=1, max_queued=1, stage_limits={})
+        scheduler.enqueue()
+        scheduler.enqueue("batch")
+        with pytest.raises(QueueFullError) as error:
+            scheduler.enqueue("batch")
+        return scheduler, error.value
+
+    scheduler, error = asyncio.run(run())
+    assert scheduler.is_full()
+    assert error.retry_after >= 1
+    assert scheduler.stats()["priorities"]["batch"]["rejected"] == 1
+
+
+def test_admission_middleware_answers_429_when_full(monkeypatch):
+    async def run():
+        scheduler = PipelineScheduler(max_active=1, max_queued=1, stage_limits={})
+        monkeypatch.setattr(scheduler_module, "_scheduler", scheduler)
+        scheduler.enqueue()
+        scheduler.enqueue()
+        called, sent = [], []
+
+        async def app(scope, receive, send):
+            called.append(scope["path"])
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/run", "headers": [(b"x-priority", b"batch")]}
+        await AdmissionMiddleware(app)(scope, None, send)
+        return scheduler, called, sent
+
+    scheduler, called, sent = asyncio.run(run())
+    assert called == []
+    assert sent[0]["status"] == 429
+    assert int(dict(sent[0]["headers"])[b"retry-after"]) >= 1
+    assert scheduler.stats()["priorities"]["batch"]["rejected"] == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = PipelineScheduler(max_active=1, max_queued=10, stage_limits={})
+        running = scheduler.enqueue()
+        waiter = scheduler.enqueue("batch")
+        task = asyncio.create_task(scheduler.wait(waiter))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        queued_after_cancel = scheduler.queued()
+        scheduler.release(running)
+        return scheduler, waiter, queued_after_cancel
+
+    scheduler, waiter, queued_after_cancel = asyncio.run(run())
+    assert queued_after_cancel == 0
+    assert waiter.admitted_at is None
+    assert scheduler.stats()["active"] == 0
+
+
+def test_stage_counters_return_to_zero():
+    async def run():
+        scheduler = PipelineScheduler(stage_limits={"story": 1})
+        during = []
+        entered = asyncio.Event()
+
+        async def first():
+            async with scheduler.stage("story") as slot:
+                entered.set()
+                await asyncio.sleep(0.01)
+                during.append(dict(scheduler.stats()["stages"]["story"]))
+                slot.release()
+                slot.release()
+
+        async def second():
+            await entered.wait()
+            async with scheduler.stage("story"):
+                during.append(dict(scheduler.stats()["stages"]["story"]))
+
+        await asyncio.gather(first(), second())
+        return during, scheduler.stats()["stages"]["story"]
+
+    during, after = asyncio.run(run())
+    assert during[0] == {"limit": 1, "active": 1, "waiting": 1}
+    assert during[1] == {"limit": 1, "active": 1, "waiting": 0}
+    assert after == {"limit": 1, "active": 0, "waiting": 0}
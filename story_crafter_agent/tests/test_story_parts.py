@@ -0,0 +1,57 @@
+"""Tests for splitting stories into Parts and replacing them."""
+
+from story_crafter_agent.tools.story_parts import anchor_numbers, parse_story, render_story, replace_part
+
+STORY = (
+    "# The Harbor\n\n"
+    "[IMAGE_1]\n\n"
+    "## Part 1: Dawn\n\nThe boat drifted.\n\n[IMAGE_2]\n\n"
+    "## Part 2: Storm\n\nThe wind rose.\n\n\n"
+    "## Part 3: Home\n\nThey came back.\n\n[IMAGE_3]\n"
+)
+
+
+def test_parse_story():
+    story = parse_story(STORY)
+    assert story["preamble"] == "# The Harbor\n\n[IMAGE_1]\n\n"
+    assert [p["number"] for p in story["parts"]] == [1, 2, 3]
+    assert [p["title"] for p in story["parts"]] == ["Dawn", "Storm", "Home"]
+    assert story["parts"][0]["anchors"] == ["IMAGE_2"]
+    assert story["parts"][1]["anchors"] == []
+
+
+def test_render_round_trips():
+    assert render_story(parse_story(STORY)) == STORY
+
+
+def test_story_without_parts():
+    story = parse_story("Just prose.")
+    assert story == {"preamble": "Just prose.", "parts": []}
+    assert render_story(story) == "Just prose."
+
+
+def test_replace_part_keeps_separator_and_rest_of_story():
+    story = parse_story(STORY)
+    new = replace_part(story, 2, "## Part 2: Thunder\n\nLightning split the mast.\n\n[IMAGE_4]")
+    text = render_story(new)
+    assert "## Part 2: Thunder\n\nLightning split the mast.\n\n[IMAGE_4]\n\n\n## Part 3: Home" in text
+    assert text.startswith("# The Harbor\n\n[IMAGE_1]\n\n## Part 1: Dawn\n\nThe boat drifted.")
+    assert text.endswith("## Part 3: Home\n\nThey came back.\n\n[IMAGE_3]\n")
+    assert new["parts"][1]["title"] == "Thunder"
+    assert new["parts"][1]["anchors"] == ["IMAGE_4"]
+    # The input is not modified
+    assert render_story(story) == STORY
+
+
+def test_replace_part_without_heading_keeps_title():
+    new = replace_part(parse_story(STORY), 3, "They sailed home at last.")
+    assert new["parts"][2]["title"] == "Home"
+    assert new["parts"][2]["text"] == "They sailed home at last.\n"
+
+
+def test_replace_unknown_part_changes_nothing():
+    assert render_story(replace_part(parse_story(STORY), 9, "Nope")) == STORY
+
+
+def test_anchor_numbers():
+    assert sorted(anchor_numbers(parse_story(STORY))) == [1, 2, 3]
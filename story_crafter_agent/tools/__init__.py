@@ -15,6 +15,9 @@ from .personalization_tools import *
 from .storyteller_tools import *
 from .image_generation_tools import *
 from .formatting_tools import *
+from .digest_tools import get_book_digest
+from .prefetch_tools import confirm_book_selection
+from .repair_tools import repair_story_parts
 
 __all__ = [
     'list_available_books',
@@ -24,4 +27,7 @@ __all__ = [
     'submit_story_with_prompts',
     'generate_image',
     'save_formatted_story',
+    'get_book_digest',
+    'confirm_book_selection',
+    'repair_story_parts',
 ]
@@ -0,0 +1,267 @@
+"""
+Book Text Helpers
+
+Helpers for reading cached Project Gutenberg texts and splitting them into
+parts and chapters.
+"""
+
+import re
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from story_crafter_agent.shared_state import file_stamp, get_snapshot
+
+BOOKS_DIR = Path(__file__).parent.parent / "cache" / "books"
+
+_START_MARKER = re.compile(r"^\*\*\*\s*START OF (THE|THIS) PROJECT GUTENBERG EBOOK.*$", re.IGNORECASE | re.MULTILINE)
+_END_MARKER = re.compile(r"^\*\*\*\s*END OF (THE|THIS) PROJECT GUTENBERG EBOOK.*$", re.IGNORECASE | re.MULTILINE)
+
+_NUMBER = r"(\d+|[IVXLCDM]+|ONE|TWO|THREE|FOUR|FIVE|SIX|SEVEN|EIGHT|NINE|TEN|One|Two|Three|Four|Five|Six|Seven|Eight|Nine|Ten)"
+_PART_HEADING = re.compile(rf"^\s*(PART|Part|BOOK|Book|VOLUME|Volume)\s+{_NUMBER}\b[.\-:—\s]*(.*)$")
+_CHAPTER_HEADING = re.compile(rf"^\s*(CHAPTER|Chapter)\s+{_NUMBER}\b[.\-:—\s]*(.*)$")
+
+_ROMAN = {"I": 1, "V": 5, "X": 10, "L": 50, "C": 100, "D": 500, "M": 1000}
+_WORDS = {
+    "ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5,
+    "SIX": 6, "SEVEN": 7, "EIGHT": 8, "NINE": 9, "TEN": 10,
+}
+
+
+def book_path(book_id: str) -> Path:
+    """Return the path of a cached book text."""
+    return BOOKS_DIR / f"{book_id}.txt"
+
+
+def book_source_path(book_id: str) -> Path:
+    """
+    Return the file a book's text is read from: the cached text, or else the
+    archive of an ingested book.
+
+    Raises:
+        FileNotFoundError: If the book is neither cached nor ingested.
+    """
+    from story_crafter_agent.tools.gutenberg_ingest import book_archive_path
+
+    file_path = book_path(book_id)
+    if file_path.exists():
+        return file_path
+    try:
+        return book_archive_path(book_id)
+    except KeyError:
+        raise FileNotFoundError(f"Book not found in cache or library: {book_id}") from None
+
+
+def load_book_text(book_id: str) -> str:
+    """
+    Load a book text with the Gutenberg header and licence stripped.
+
+    Cached texts (`cache/books`) take precedence over ingested books.
+
+    Raises:
+        FileNotFoundError: If the book is neither cached nor ingested.
+    """
+    from story_crafter_agent.tools.gutenberg_ingest import read_book
+
+    file_path = book_path(book_id)
+    if file_path.exists():
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            return strip_gutenberg_boilerplate(f.read())
+    try:
+        return read_book(book_id)
+    except KeyError:
+        raise FileNotFoundError(f"Book not found in cache or library: {book_id}") from None
+
+
+def strip_gutenberg_boilerplate(text: str) -> str:
+    """Remove the BOM and the Project Gutenberg header/footer from a text."""
+    text = text.lstrip("﻿").replace("\r\n", "\n")
+    start = _START_MARKER.search(text)
+    if start:
+        text = text[start.end():]
+    end = _END_MARKER.search(text)
+    if end:
+        text = text[:end.start()]
+    return text.strip("\n")
+
+
+def _parse_number(token: str) -> int:
+    token = token.upper()
+    if token.isdigit():
+        return int(token)
+    if token in _WORDS:
+        return _WORDS[token]
+    total = 0
+    for i, ch in enumerate(token):
+        value = _ROMAN[ch]
+        if i + 1 < len(token) and _ROMAN[token[i + 1]] > value:
+            total -= value
+        else:
+            total += value
+    return total
+
+
+def _heading_title(lines: List[str], index: int, inline: str) -> str:
+    """Use the inline title if present, else a short line right after the heading."""
+    inline = inline.strip().rstrip(".")
+    if inline:
+        return inline
+    for n in range(index + 1, min(index + 4, len(lines))):
+        candidate = lines[n].strip()
+        if not candidate:
+            continue
+        # A title stands on its own line, followed by a blank line
+        followed_by_blank = n + 1 >= len(lines) or not lines[n + 1].strip()
+        if len(candidate) <= 70 and followed_by_blank:
+            return candidate.rstrip(".")
+        break
+    return ""
+
+
+def split_chapters(text: str) -> List[Dict[str, Any]]:
+    """
+    Split a book text into chapters.
+
+    Chapter and part headings ("PART 2", "Chapter IV", "CHAPTER I.") are
+    detected line by line. When a heading repeats (e.g. a table of contents
+    followed by the real chapters), everything before the repeated heading is
+    treated as front matter.
+
+    Args:
+        text: Book text, usually from `load_book_text`.
+
+    Returns:
+        List of chapter dicts with index, part, part_title, number, title,
+        start and end (character offsets into `text`) and words. Front matter,
+        when present, is returned as chapter number 0.
+    """
+    lines = text.split("\n")
+    headings = []  # (offset, part, part_title, number, title)
+    seen = {}
+    part, part_title = None, ""
+    offset = 0
+    for i, line in enumerate(lines):
+        part_match = _PART_HEADING.match(line)
+        chapter_match = _CHAPTER_HEADING.match(line) if not part_match else None
+        if part_match and len(line.strip()) <= 80:
+            part = _parse_number(part_match.group(2))
+            part_title = _heading_title(lines, i, part_match.group(3))
+        elif chapter_match and len(line.strip()) <= 80:
+            number = _parse_number(chapter_match.group(2))
+            key = (part, number)
+            if key in seen:
+                # Heading seen before: the earlier run was a table of contents
+                headings = headings[:seen[key]]
+                seen = {k: v for k, v in seen.items() if v < len(headings)}
+            seen[key] = len(headings)
+            headings.append((offset, part, part_title, number, _heading_title(lines, i, chapter_match.group(3))))
+        offset += len(line) + 1
+
+    chapters = []
+    first_start = headings[0][0] if headings else len(text)
+    if text[:first_start].strip():
+        chapters.append({
+            "part": None, "part_title": "", "number": 0, "title": "Front matter",
+            "start": 0, "end": first_start,
+        })
+    for n, (start, part, part_title, number, title) in enumerate(headings):
+        end = headings[n + 1][0] if n + 1 < len(headings) else len(text)
+        chapters.append({
+            "part": part, "part_title": part_title, "number": number, "title": title,
+            "start": start, "end": end,
+        })
+    for index, chapter in enumerate(chapters):
+        chapter["index"] = index
+        chapter["words"] = len(text[chapter["start"]:chapter["end"]].split())
+    return chapters
+
+
+def group_parts(chapters: List[Dict[str, Any]], chapters_per_part: int = 8) -> List[Dict[str, Any]]:
+    """
+    Group story chapters into parts.
+
+    Books with explicit parts keep them; otherwise consecutive chapters are
+    grouped so that the part level stays meaningful for long books.
+
+    Returns:
+        List of part dicts with part, title and chapter_indexes.
+    """
+    story = [c for c in chapters if c["number"] != 0] or chapters
+    parts: List[Dict[str, Any]] = []
+    if any(c["part"] is not None for c in story):
+        for chapter in story:
+            if not parts or parts[-1]["part"] != chapter["part"]:
+                parts.append({"part": chapter["part"], "title": chapter["part_title"], "chapter_indexes": []})
+            parts[-1]["chapter_indexes"].append(chapter["index"])
+        return parts
+    for n in range(0, len(story), chapters_per_part):
+        group = story[n:n + chapters_per_part]
+        parts.append({
+            "part": len(parts) + 1,
+            "title": "",
+            "chapter_indexes": [c["index"] for c in group],
+        })
+    return parts
+
+
+def chapter_text(text: str, chapter: Dict[str, Any], max_chars: Optional[int] = None) -> str:
+    """Return the text of a chapter, optionally truncated to `max_chars`."""
+    body = text[chapter["start"]:chapter["end"]].strip()
+    if max_chars is not None and len(body) > max_chars:
+        body = body[:max_chars]
+    return body
+
+
+def split_text(body: str, max_chars: int) -> List[str]:
+    """
+    Split text into chunks of at most `max_chars`, at paragraph boundaries
+    where possible (a single oversized paragraph is cut at `max_chars`).
+    """
+    chunks: List[str] = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", body):
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + 2 + len(paragraph) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+_chapter_index_cache: Dict[tuple, List[Dict[str, Any]]] = {}
+
+
+def chapter_index_stamp(book_id: str) -> List[Optional[int]]:
+    """Modification time of the file a book's chapter index is built from."""
+    try:
+        return file_stamp(book_source_path(book_id))
+    except FileNotFoundError:
+        return [None]
+
+
+def get_chapter_index(book_id: str) -> List[Dict[str, Any]]:
+    """
+    Return the chapter index of a book, memoized until the file changes.
+
+    In multi-worker mode the index is read from the shared snapshot, unless
+    the book changed since the snapshot was built.
+
+    Raises:
+        FileNotFoundError: If the book is neither cached nor ingested.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        chapters = snapshot.get_fresh(f"chapters:{book_id}", chapter_index_stamp(book_id))
+        if chapters is not None:
+            return chapters
+    file_path = book_source_path(book_id)
+    key = (book_id, file_path.stat().st_mtime_ns)
+    if key not in _chapter_index_cache:
+        _chapter_index_cache[key] = split_chapters(load_book_text(book_id))
+    return _chapter_index_cache[key]
@@ -0,0 +1,418 @@
+"""
+Digest Tools
+
+Offline map-reduce digests of cached books. Chapters are summarized in
+parallel, then reduced into part and book digests that are stored on disk,
+versioned by schema and source text. The StoryTellerAgent reads the
+precomputed digest at the granularity the requested story length needs, so
+generation time no longer depends on book size.
+
+Build digests ahead of time with:
+
+    python -m story_crafter_agent.tools.digest_tools 1268 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+from story_crafter_agent.shared_state import file_stamp, get_snapshot
+from story_crafter_agent.tools.book_text import (
+    BOOKS_DIR,
+    book_path,
+    book_source_path,
+    load_book_text,
+    split_chapters,
+    group_parts,
+    chapter_text,
+    split_text,
+)
+from story_crafter_agent.tools.gutenberg_ingest import load_catalog
+
+DIGESTS_DIR = Path(__file__).parent.parent / "cache" / "digests"
+# v2: oversized chapters are summarized in chunks instead of truncated
+DIGEST_SCHEMA_VERSION = 2
+DIGEST_MODEL = os.getenv("DIGEST_MODEL", "gemini-2.0-flash-exp")
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "8"))
+
+# Passes over the chapters whose summary failed (after `_summarize`'s own retries)
+CHAPTER_PASSES = 2
+
+# Roughly 30k tokens; longer chapters are split into chunks that are
+# summarized separately and then reduced into the chapter summary
+MAX_CHAPTER_CHARS = 120_000
+
+# Story length -> digest level the storyteller should work from
+LENGTH_GRANULARITY = {
+    "short": "book",
+    "medium": "part",
+    "full": "chapter",
+}
+
+_CHAPTER_PROMPT = """Summarize this chapter of "{title}" for a writer who will adapt the book.
+Cover the key events in order, the characters involved and any turning points.
+Write 150-250 words of plain prose, no headings.
+
+{text}"""
+
+_CHUNK_PROMPT = """Summarize this section ({position}) of a long chapter of "{title}" for a writer who will adapt the book.
+Cover the key events in order, the characters involved and any turning points.
+Write 100-200 words of plain prose, no headings.
+
+{text}"""
+
+_REDUCE_PROMPT = """Combine these consecutive summaries of "{title}" into one {level} summary.
+Keep the main plot line, key characters, settings and themes in order.
+Write {words} words of plain prose, no headings.
+
+{text}"""
+
+
+def _source_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+_source_hash_cache: Dict[tuple, str] = {}
+
+
+def _current_source_hash(book_id: str) -> str:
+    """Hash of the book text, memoized until the file changes."""
+    key = (book_id, book_source_path(book_id).stat().st_mtime_ns)
+    if key not in _source_hash_cache:
+        _source_hash_cache[key] = _source_hash(load_book_text(book_id))
+    return _source_hash_cache[key]
+
+
+def digest_path(book_id: str, source_hash: str) -> Path:
+    """Return the on-disk location of a digest for a given book text version."""
+    return DIGESTS_DIR / book_id / f"v{DIGEST_SCHEMA_VERSION}-{source_hash}.json"
+
+
+def _checkpoint_path(target: Path) -> Path:
+    """Where chapter summaries are kept while a digest is being built."""
+    return target.with_name(f"partial-{target.name}")
+
+
+def _write_json(path: Path, data: Any) -> None:
+    """Write atomically so readers never see a half-written file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _book_title(book_id: str) -> str:
+    """
+    Read the title from the Gutenberg header (or the ingestion catalog for
+    ingested books), falling back to the book ID.
+    """
+    if not book_path(book_id).exists():
+        return load_catalog().get(book_id, {}).get("title") or f"Book {book_id}"
+    with open(book_path(book_id), 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            if line.startswith("Title:"):
+                return line.split(":", 1)[1].strip()
+            if line.startswith("***"):
+                break
+    return f"Book {book_id}"
+
+
+async def _summarize(client, semaphore: asyncio.Semaphore, model: str, prompt: str, retries: int = 2) -> str:
+    """Run one summarization call, bounded by the shared semaphore."""
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                response = await client.aio.models.generate_content(model=model, contents=prompt)
+                return (response.text or "").strip()
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                print(f"⚠️  Digest call failed (attempt {attempt + 1}/{retries + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+    return ""
+
+
+async def _summarize_chapter(client, semaphore: asyncio.Semaphore, model: str, title: str, body: str) -> str:
+    """Summarize one chapter, map-reducing over chunks when it is too long for one call."""
+    chunks = split_text(body, MAX_CHAPTER_CHARS)
+    if len(chunks) <= 1:
+        return await _summarize(client, semaphore, model, _CHAPTER_PROMPT.format(title=title, text=body))
+    chunk_summaries = await asyncio.gather(*(
+        _summarize(client, semaphore, model, _CHUNK_PROMPT.format(
+            title=title, position=f"part {i + 1} of {len(chunks)}", text=chunk))
+        for i, chunk in enumerate(chunks)
+    ))
+    return await _summarize(client, semaphore, model, _REDUCE_PROMPT.format(
+        title=title, level="chapter", words="150-250",
+        text="\n\n".join(s for s in chunk_summaries if s)))
+
+
+async def build_digest_async(
+    book_id: str,
+    model: str = DIGEST_MODEL,
+    concurrency: int = DIGEST_CONCURRENCY,
+    force: bool = False,
+) -> Path:
+    """
+    Build the chapter -> part -> book digest for a cached book.
+
+    Chapter summaries are checkpointed as they are collected. Chapters that
+    still fail after `CHAPTER_PASSES` passes are left out of the reduce and
+    listed in the digest's `failed_chapters`; running the build again only
+    summarizes those chapters.
+
+    Args:
+        book_id: ID of a book in `cache/books` or the ingested library.
+        model: Gemini model used for the map and reduce calls.
+        concurrency: Maximum number of summarization calls in flight.
+        force: Rebuild even if a digest for this text version exists.
+
+    Returns:
+        Path of the digest file.
+
+    Raises:
+        RuntimeError: If no chapter could be summarized.
+    """
+    from google import genai
+
+    text = load_book_text(book_id)
+    source_hash = _source_hash(text)
+    target = digest_path(book_id, source_hash)
+    checkpoint = _checkpoint_path(target)
+
+    # Summaries from an earlier, partial build of this text version
+    summary_by_index: Dict[int, str] = {}
+    if not force:
+        if target.exists():
+            with open(target, 'r', encoding='utf-8') as f:
+                existing = json.load(f)
+            failed = set(existing.get("failed_chapters", []))
+            if not failed:
+                print(f"✓ Digest already up to date: {target}")
+                return target
+            summary_by_index.update(
+                (c["index"], c["summary"]) for c in existing["chapters"] if c["index"] not in failed
+            )
+        if checkpoint.exists():
+            with open(checkpoint, 'r', encoding='utf-8') as f:
+                summary_by_index.update((int(i), summary) for i, summary in json.load(f).items())
+
+    title = _book_title(book_id)
+    chapters = split_chapters(text)
+    parts = group_parts(chapters)
+    story_indexes = [i for p in parts for i in p["chapter_indexes"]]
+
+    client = genai.Client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    # Map: every missing chapter in parallel; one failure does not discard the others
+    missing = [i for i in story_indexes if i not in summary_by_index]
+    errors: Dict[int, BaseException] = {}
+    for attempt in range(CHAPTER_PASSES):
+        if not missing:
+            break
+        if attempt == 0:
+            print(f"Summarizing {len(missing)} chapters of '{title}' ({concurrency} at a time)...")
+        else:
+            print(f"⚠️  Retrying {len(missing)} failed chapters of '{title}'...")
+        results = await asyncio.gather(*(
+            _summarize_chapter(client, semaphore, model, title, chapter_text(text, chapters[i]))
+            for i in missing
+        ), return_exceptions=True)
+        for i, result in zip(missing, results):
+            if isinstance(result, BaseException):
+                errors[i] = result
+            else:
+                summary_by_index[i] = result
+        missing = [i for i in missing if i not in summary_by_index]
+        _write_json(checkpoint, {str(i): summary for i, summary in summary_by_index.items()})
+
+    if len(missing) == len(story_indexes):
+        raise RuntimeError(f"No chapter of book {book_id} could be summarized: {errors[missing[0]]}")
+    for i in missing:
+        print(f"⚠️  Chapter {chapters[i]['index']} left out of the digest: {errors[i]}")
+
+    # Reduce: chapters -> parts -> book, over the chapters that were summarized
+    def _joined(summaries: List[str]) -> str:
+        return "\n\n".join(s for s in summaries if s)
+
+    async def _reduce_part(part: Dict[str, Any]) -> str:
+        joined = _joined([summary_by_index.get(i, "") for i in part["chapter_indexes"]])
+        if not joined:
+            return ""
+        return await _summarize(client, semaphore, model, _REDUCE_PROMPT.format(
+            title=title, level="part", words="300-500", text=joined))
+
+    part_summaries = await asyncio.gather(*(_reduce_part(p) for p in parts))
+    book_summary = await _summarize(client, semaphore, model, _REDUCE_PROMPT.format(
+        title=title, level="whole-book", words="500-800", text=_joined(part_summaries)))
+
+    digest = {
+        "book_id": book_id,
+        "title": title,
+        "schema_version": DIGEST_SCHEMA_VERSION,
+        "source_hash": source_hash,
+        "model": model,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "book": {"summary": book_summary},
+        "parts": [
+            {
+                "part": p["part"],
+                "title": p["title"],
+                "chapter_indexes": p["chapter_indexes"],
+                "summary": summary,
+            }
+            for p, summary in zip(parts, part_summaries)
+        ],
+        "chapters": [
+            {
+                "index": chapters[i]["index"],
+                "part": chapters[i]["part"],
+                "number": chapters[i]["number"],
+                "title": chapters[i]["title"],
+                "words": chapters[i]["words"],
+                "summary": summary_by_index.get(i, ""),
+            }
+            for i in story_indexes
+        ],
+        "failed_chapters": [chapters[i]["index"] for i in missing],
+    }
+
+    _write_json(target, digest)
+    # The digest now holds every summary collected so far
+    checkpoint.unlink(missing_ok=True)
+    if missing:
+        print(f"⚠️  Partial digest saved ({len(missing)} chapters missing, run again to retry): {target}")
+    else:
+        print(f"✓ Digest saved: {target}")
+    return target
+
+
+def build_digest(book_id: str, **kwargs) -> Path:
+    """Synchronous wrapper around `build_digest_async`."""
+    return asyncio.run(build_digest_async(book_id, **kwargs))
+
+
+_digest_cache: Dict[tuple, Dict[str, Any]] = {}
+
+
+def digest_stamp(book_id: str) -> List[Optional[int]]:
+    """
+    Modification times of a book's digest directory (any digest written or
+    removed) and of its text (which decides the current digest).
+    """
+    try:
+        source = book_source_path(book_id)
+    except FileNotFoundError:
+        source = None
+    return file_stamp(DIGESTS_DIR / book_id) + (file_stamp(source) if source is not None else [None])
+
+
+def load_digest(book_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the digest for a book.
+
+    Prefers the digest matching the current book text; falls back to the most
+    recent digest of the current schema (flagged as stale). Returns None if
+    no digest has been built. In multi-worker mode the digest is read from
+    the shared snapshot, unless digests were rebuilt since it was built.
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        digest = snapshot.get_fresh(f"digest:{book_id}", digest_stamp(book_id))
+        if digest is not None:
+            return digest
+
+    book_dir = DIGESTS_DIR / book_id
+    if not book_dir.exists():
+        return None
+    candidates = sorted(
+        book_dir.glob(f"v{DIGEST_SCHEMA_VERSION}-*.json"),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    if not candidates:
+        return None
+
+    stale = False
+    try:
+        current = digest_path(book_id, _current_source_hash(book_id))
+    except FileNotFoundError:
+        current = None
+    if current in candidates:
+        chosen = current
+    else:
+        chosen, stale = candidates[0], True
+
+    # Keyed by mtime too: a partial digest is rewritten in place when completed
+    key = (chosen, chosen.stat().st_mtime_ns)
+    if key not in _digest_cache:
+        with open(chosen, 'r', encoding='utf-8') as f:
+            _digest_cache[key] = json.load(f)
+    digest = _digest_cache[key]
+    return {**digest, "stale": stale} if stale else digest
+
+
+def get_book_digest(book_id: str, length: str = "Medium") -> Dict[str, Any]:
+    """
+    Get a precomputed digest of a book at the granularity a story length needs.
+
+    Short stories get the whole-book summary, Medium stories get part
+    summaries and Full stories get chapter summaries.
+
+    Args:
+        book_id: The ID of the book (e.g., '1268').
+        length: Requested story length ('Short', 'Medium' or 'Full').
+
+    Returns:
+        The digest at the matching granularity, or an error if none was built.
+    """
+    digest = load_digest(book_id)
+    if digest is None:
+        return {"error": f"No digest available for book {book_id}. Use get_book_details instead."}
+
+    granularity = LENGTH_GRANULARITY.get(length.strip().lower(), "part")
+    result: Dict[str, Any] = {
+        "book_id": book_id,
+        "title": digest["title"],
+        "granularity": granularity,
+        "book_summary": digest["book"]["summary"],
+    }
+    if digest.get("failed_chapters"):
+        # Chapters missing from the summaries; get_book_details covers them
+        result["failed_chapters"] = digest["failed_chapters"]
+    if granularity == "part":
+        result["parts"] = [
+            {"part": p["part"], "title": p["title"], "summary": p["summary"]}
+            for p in digest["parts"]
+        ]
+    elif granularity == "chapter":
+        result["chapters"] = [
+            {"part": c["part"], "number": c["number"], "title": c["title"], "summary": c["summary"]}
+            for c in digest["chapters"]
+        ]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build chapter/part/book digests for cached books.")
+    parser.add_argument("book_ids", nargs="*",
+                        help="Book IDs to digest, cached or ingested (default: every cached book)")
+    parser.add_argument("--model", default=DIGEST_MODEL)
+    parser.add_argument("--concurrency", type=int, default=DIGEST_CONCURRENCY)
+    parser.add_argument("--force", action="store_true", help="Rebuild existing digests")
+    args = parser.parse_args(argv)
+
+    book_ids = args.book_ids or sorted(p.stem for p in BOOKS_DIR.glob("*.txt"))
+    for book_id in book_ids:
+        build_digest(book_id, model=args.model, concurrency=args.concurrency, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,20 @@
+import asyncio
 import os
 import re
 from datetime import datetime
 from typing import Optional
 
+from google.adk.tools import ToolContext
 
-def save_formatted_story(
+from story_crafter_agent.artifact_catalog import get_artifact_catalog
+
+
+async def save_formatted_story(
     markdown_content: str, 
     book_id: Optional[str] = None,
     book_title: Optional[str] = None,
-    filename: Optional[str] = None
+    filename: Optional[str] = None,
+    tool_context: Optional[ToolContext] = None
 ) -> str:
     """
     Saves the final Markdown content to a file with enhanced formatting.
@@ -45,12 +51,33 @@ def save_formatted_story(
     
     file_path = os.path.join(output_dir, filename)
     
-    with open(file_path, "w") as f:
-        f.write(enhanced_content)
+    # File and catalog writes run off the event loop
+    await asyncio.to_thread(_write_file, file_path, enhanced_content)
+    
+    # Index the story with its book, profile and images
+    try:
+        state = tool_context.state if tool_context is not None else {}
+        user_id = tool_context.session.user_id if tool_context is not None else None
+        await asyncio.to_thread(
+            get_artifact_catalog().record_story,
+            file_path,
+            enhanced_content,
+            book_id=book_id or state.get("selected_book_id"),
+            book_title=book_title,
+            profile=state.get("personalization_profile"),
+            user_id=user_id,
+        )
+    except Exception as e:
+        print(f"⚠️  Could not record story in artifact catalog: {e}")
         
     return os.path.abspath(file_path)
 
 
+def _write_file(file_path: str, content: str) -> None:
+    with open(file_path, "w") as f:
+        f.write(content)
+
+
 def _enhance_markdown_layout(content: str) -> str:
     """
     Wraps markdown content with HTML/CSS for better book-like presentation.
@@ -0,0 +1,385 @@
+"""
+Gutenberg Ingestion
+
+Bulk ingestion of Project Gutenberg texts into the local library.
+
+Each source text is decoded, stripped of its BOM and licence boilerplate,
+split into chapters and stored as one zstd frame per chapter; readers
+decompress the frames in order to get the text back. Each book has a small
+index file with its chapter offsets, and a catalog file records the id,
+title, author and language of every book. Editions of the same work are
+deduplicated, keeping the most complete text.
+
+    python -m story_crafter_agent.tools.gutenberg_ingest ~/gutenberg-mirror --workers 8
+    python -m story_crafter_agent.tools.gutenberg_ingest gutenberg-texts.zip
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import tarfile
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+import zstandard
+
+from story_crafter_agent.tools.book_text import strip_gutenberg_boilerplate, split_chapters
+
+LIBRARY_DIR = Path(__file__).parent.parent / "cache" / "library"
+CATALOG_PATH = LIBRARY_DIR / "catalog.json"
+STAGING_DIR = LIBRARY_DIR / "staging"
+ZSTD_LEVEL = int(os.getenv("LIBRARY_ZSTD_LEVEL", "12"))
+
+_TEXT_SUFFIXES = (".txt",)
+_ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+_HEADER_FIELDS = {
+    "title": re.compile(r"^Title:\s*(.+)$", re.MULTILINE),
+    "author": re.compile(r"^(?:Author|Editor|Translator):\s*(.+)$", re.MULTILINE),
+    "language": re.compile(r"^Language:\s*(.+)$", re.MULTILINE),
+}
+_EBOOK_NUMBER = re.compile(r"\[(?:e-?book|etext)\s*#\s*(\d+)\]", re.IGNORECASE)
+
+
+def book_index_path(book_id: str) -> Path:
+    """Return the path of a book's index (archive name and chapter offsets)."""
+    return LIBRARY_DIR / "books" / f"{book_id}.json"
+
+
+_index_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+
+def load_book_index(book_id: str) -> Dict[str, Any]:
+    """
+    Load a book's index, memoized until the file changes.
+
+    Raises:
+        KeyError: If the book has not been ingested.
+    """
+    path = book_index_path(book_id)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise KeyError(book_id) from None
+    cached = _index_cache.get(book_id)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = (mtime, json.load(f))
+        _index_cache[book_id] = cached
+    return cached[1]
+
+
+def book_archive_path(book_id: str) -> Path:
+    """Return the path of a book's compressed chapter frames."""
+    return LIBRARY_DIR / "books" / load_book_index(book_id)["archive"]
+
+
+def decode_text(raw: bytes) -> str:
+    """Decode a Gutenberg text, trying UTF-8 first and then legacy encodings."""
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            text = raw.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = raw.decode("latin-1")
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return unicodedata.normalize("NFC", text)
+
+
+def parse_header(text: str, fallback_id: str) -> Dict[str, str]:
+    """Read id, title, author and language from the Gutenberg header."""
+    header = text[:10_000]
+    metadata = {"id": fallback_id, "title": "", "author": "", "language": ""}
+    for field, pattern in _HEADER_FIELDS.items():
+        match = pattern.search(header)
+        if match:
+            metadata[field] = match.group(1).strip()
+    ebook = _EBOOK_NUMBER.search(header)
+    if ebook:
+        metadata["id"] = ebook.group(1)
+    return metadata
+
+
+def edition_key(entry: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Key identifying the same work across Gutenberg editions."""
+    def _normalize(value: str) -> str:
+        value = re.sub(r"[^\w\s]", " ", value.lower())
+        value = re.sub(r"^(the|a|an)\s+", "", value.strip())
+        return " ".join(value.split())
+    return (_normalize(entry["title"]), _normalize(entry["author"]), entry["language"].lower())
+
+
+def _ingest_one(source: str, member: Optional[str], raw: Optional[bytes], level: int) -> Dict[str, Any]:
+    """
+    Process pool worker: normalize, split and compress one book.
+
+    The source is either a file path, a zip member (`source`, `member`), or
+    raw bytes already read from a streaming archive. The frames are written
+    to a staging file named after the source, since several sources can
+    carry the same ebook number; the parent picks one per ID.
+    """
+    name = member or source
+    try:
+        if raw is None:
+            if member is not None:
+                with zipfile.ZipFile(source) as archive:
+                    raw = archive.read(member)
+            else:
+                with open(source, 'rb') as f:
+                    raw = f.read()
+
+        text = decode_text(raw)
+        fallback_id = re.sub(r"\D", "", Path(name).stem.split("-")[0]) or Path(name).stem
+        metadata = parse_header(text, fallback_id)
+        body = strip_gutenberg_boilerplate(text)
+        chapters = split_chapters(body)
+
+        compressor = zstandard.ZstdCompressor(level=level)
+        STAGING_DIR.mkdir(parents=True, exist_ok=True)
+        source_key = hashlib.sha1(f"{source}\0{member or ''}".encode("utf-8")).hexdigest()[:16]
+        staged = STAGING_DIR / f"{source_key}.zst"
+        offset = 0
+        index = []
+        with open(staged, 'wb') as f:
+            for chapter in chapters:
+                frame = compressor.compress(body[chapter["start"]:chapter["end"]].encode("utf-8"))
+                f.write(frame)
+                index.append({
+                    "index": chapter["index"],
+                    "part": chapter["part"],
+                    "number": chapter["number"],
+                    "title": chapter["title"],
+                    "words": chapter["words"],
+                    "offset": offset,
+                    "length": len(frame),
+                })
+                offset += len(frame)
+
+        return {
+            **metadata,
+            "source": f"{source}:{member}" if member else source,
+            "sha256": hashlib.sha256(body.encode("utf-8")).hexdigest(),
+            "chars": len(body),
+            "raw_bytes": len(raw),
+            "stored_bytes": offset,
+            "chapters": index,
+            "staged": str(staged),
+        }
+    except Exception as e:
+        return {"error": f"{name}: {e}"}
+
+
+def _iter_sources(path: Path):
+    """Yield (source, member, raw) work items for a directory or archive."""
+    if path.is_dir():
+        for file_path in sorted(path.rglob("*")):
+            if file_path.is_file() and file_path.name.lower().endswith(_TEXT_SUFFIXES):
+                yield str(file_path), None, None
+    elif path.name.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.lower().endswith(_TEXT_SUFFIXES):
+                    yield str(path), member, None
+    elif path.name.lower().endswith(_ARCHIVE_SUFFIXES):
+        # Tar streams are not seekable per member, so read them here (the
+        # caller bounds how many are in flight)
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(_TEXT_SUFFIXES):
+                    yield str(path), member.name, archive.extractfile(member).read()
+    elif path.is_file():
+        yield str(path), None, None
+    else:
+        raise FileNotFoundError(f"Nothing to ingest at: {path}")
+
+
+def load_catalog() -> Dict[str, Dict[str, Any]]:
+    """Load the library catalog, keyed by book ID."""
+    if not CATALOG_PATH.exists():
+        return {}
+    with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_catalog(catalog: Dict[str, Dict[str, Any]]) -> None:
+    """Write the catalog atomically."""
+    CATALOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = CATALOG_PATH.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False)
+    os.replace(tmp_path, CATALOG_PATH)
+
+
+def _rank(entry: Dict[str, Any]):
+    """Sort key: most complete text first, then lowest ebook number."""
+    book_id = entry["id"]
+    return (-entry["chars"], int(book_id) if book_id.isdigit() else float("inf"), book_id, entry.get("source", ""))
+
+
+def _publish(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Move a staged book into the library and return its catalog entry."""
+    book_id = result["id"]
+    books_dir = LIBRARY_DIR / "books"
+    books_dir.mkdir(parents=True, exist_ok=True)
+    archive = f"{book_id}-{result['sha256'][:12]}.zst"
+    try:
+        previous = load_book_index(book_id)["archive"]
+    except KeyError:
+        previous = None
+    os.replace(result["staged"], books_dir / archive)
+
+    # The index names the archive, so replacing it switches readers over atomically
+    index_path = book_index_path(book_id)
+    tmp_path = index_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"id": book_id, "archive": archive, "chapters": result["chapters"]}, f)
+    os.replace(tmp_path, index_path)
+    if previous and previous != archive:
+        (books_dir / previous).unlink(missing_ok=True)
+
+    entry = {k: v for k, v in result.items() if k not in ("chapters", "staged")}
+    entry["chapter_count"] = len(result["chapters"])
+    return entry
+
+
+def _remove_book(book_id: str) -> None:
+    try:
+        archive = book_archive_path(book_id)
+    except KeyError:
+        return
+    book_index_path(book_id).unlink(missing_ok=True)
+    archive.unlink(missing_ok=True)
+    _index_cache.pop(book_id, None)
+
+
+def _deduplicate(catalog: Dict[str, Dict[str, Any]]) -> List[str]:
+    """
+    Drop duplicate texts and editions from the catalog.
+
+    Identical texts and editions of the same work (same title, author and
+    language) keep the longest text, then the lowest ebook number.
+
+    Returns:
+        IDs removed from the catalog.
+    """
+    seen_hashes, seen_editions, keep = set(), set(), set()
+    for entry in sorted(catalog.values(), key=_rank):
+        edition = edition_key(entry) if entry["title"] else None
+        if entry["sha256"] in seen_hashes or (edition and edition in seen_editions):
+            continue
+        seen_hashes.add(entry["sha256"])
+        if edition:
+            seen_editions.add(edition)
+        keep.add(entry["id"])
+
+    removed = [book_id for book_id in catalog if book_id not in keep]
+    for book_id in removed:
+        del catalog[book_id]
+        _remove_book(book_id)
+    return removed
+
+
+def ingest(path: Path, workers: Optional[int] = None, level: int = ZSTD_LEVEL) -> Dict[str, Any]:
+    """
+    Ingest a directory or archive of Gutenberg texts into the library.
+
+    Workers compress every source into a staging file. Once all are done,
+    the most complete text per ebook number (including a previously ingested
+    one) is moved into the library and the others are discarded, so the
+    stored frames and the catalog always come from the same edition.
+
+    Args:
+        path: Directory of .txt files, a single .txt file, or a zip/tar archive.
+        workers: Size of the process pool (default: CPU count).
+        level: zstd compression level.
+
+    Returns:
+        Summary with counts of ingested, duplicate and failed books.
+    """
+    started = time.monotonic()
+    catalog = load_catalog()
+    errors = []
+    candidates: Dict[str, List[Dict[str, Any]]] = {}
+    max_in_flight = 4 * (workers or os.cpu_count() or 1)
+
+    def _collect(future) -> None:
+        result = future.result()
+        if "error" in result:
+            errors.append(result["error"])
+        else:
+            candidates.setdefault(result["id"], []).append(result)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            for source, member, raw in _iter_sources(path):
+                # Bounded, so an archive is never held in memory all at once
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _collect(future)
+                pending.add(pool.submit(_ingest_one, source, member, raw, level))
+            for future in pending:
+                _collect(future)
+
+        same_id_duplicates = 0
+        ingested = 0
+        for book_id, results in candidates.items():
+            results.sort(key=_rank)
+            winner = results[0]
+            same_id_duplicates += len(results) - 1
+            existing = catalog.get(book_id)
+            if existing is not None and existing["sha256"] != winner["sha256"] \
+                    and existing["chars"] > winner["chars"]:
+                same_id_duplicates += 1
+                continue
+            catalog[book_id] = _publish(winner)
+            ingested += 1
+    finally:
+        for results in candidates.values():
+            for result in results:
+                Path(result["staged"]).unlink(missing_ok=True)
+
+    duplicates = _deduplicate(catalog)
+    save_catalog(catalog)
+
+    raw_bytes = sum(entry["raw_bytes"] for entry in catalog.values())
+    stored_bytes = sum(entry["stored_bytes"] for entry in catalog.values())
+    return {
+        "ingested": ingested,
+        "duplicates_removed": same_id_duplicates + len(duplicates),
+        "failed": len(errors),
+        "errors": errors[:20],
+        "books_in_catalog": len(catalog),
+        "compression_ratio": round(raw_bytes / stored_bytes, 2) if stored_bytes else None,
+        "seconds": round(time.monotonic() - started, 1),
+    }
+
+
+def read_book(book_id: str) -> str:
+    """Read the full text of an ingested book (all frames in order)."""
+    with open(book_archive_path(book_id), 'rb') as f:
+        reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        return reader.read().decode("utf-8")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ingest Project Gutenberg texts into the local library.")
+    parser.add_argument("source", type=Path, help="Directory, .txt file or zip/tar archive of Gutenberg texts")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    parser.add_argument("--level", type=int, default=ZSTD_LEVEL, help="zstd compression level")
+    args = parser.parse_args(argv)
+
+    summary = ingest(args.source, workers=args.workers, level=args.level)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
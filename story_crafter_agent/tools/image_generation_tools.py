@@ -1,20 +1,52 @@
+import asyncio
 import os
-import requests
+import httpx
 import uuid
-import time
 from pathlib import Path
+from typing import Optional
 
-def generate_image(prompt: str, output_dir: str = "generated_images") -> str:
+from google.adk.tools import ToolContext
+
+from story_crafter_agent.artifact_catalog import get_artifact_catalog
+from story_crafter_agent.scheduler import get_scheduler
+
+# Session state key: anchor -> {"prompt", "path"} of the images generated for the current story
+STORY_IMAGES_KEY = "story_images"
+
+
+def _remember_image(tool_context: Optional[ToolContext], anchor: Optional[str], prompt: str, path: str) -> str:
+    if tool_context is not None and anchor:
+        images = dict(tool_context.state.get(STORY_IMAGES_KEY) or {})
+        images[anchor.strip().strip("[]")] = {"prompt": prompt, "path": path}
+        tool_context.state[STORY_IMAGES_KEY] = images
+    return path
+
+
+async def generate_image(
+    prompt: str,
+    anchor: Optional[str] = None,
+    output_dir: str = "generated_images",
+    tool_context: Optional[ToolContext] = None,
+) -> str:
     """
     Generates an image using the Airbrush.ai API and saves it to the specified directory.
     
     Args:
         prompt: The text description for the image.
+        anchor: The story anchor the image is for (e.g., "IMAGE_1"). When this
+            anchor already has an image from the same prompt in the current
+            story (e.g., a Part kept by `repair_story_parts`), it is reused.
         output_dir: The directory to save the generated image.
         
     Returns:
         The absolute path to the saved image file, or a placeholder path if API is not configured.
     """
+    if tool_context is not None and anchor:
+        previous = (tool_context.state.get(STORY_IMAGES_KEY) or {}).get(anchor.strip().strip("[]"))
+        if previous and previous.get("prompt") == prompt and os.path.exists(previous.get("path", "")):
+            print(f"✓ Reusing image for unchanged {anchor}: {prompt[:50]}...")
+            return previous["path"]
+
     api_key = os.environ.get("AIRBRUSH_API_KEY")
     base_url = os.environ.get("AIRBRUSH_BASE_URL")
     
@@ -41,22 +73,25 @@ def generate_image(prompt: str, output_dir: str = "generated_images") -> str:
             # Add a delay between requests to avoid rate limiting
             # Always delay on retries, and add a small delay even on first attempt
             if attempt > 0:
-                time.sleep(retry_delay)
+                await asyncio.sleep(retry_delay)
             else:
-                time.sleep(0.5)  # Small delay even on first attempt
-            
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            data = response.json()
+                await asyncio.sleep(0.5)  # Small delay even on first attempt
             
-            if not data.get("success"):
-                raise Exception(f"Airbrush API error: {data}")
-                
-            image_url = data["data"]["image_url"]
-            
-            # Download the image
-            img_response = requests.get(image_url, timeout=60)
-            img_response.raise_for_status()
+            # Bounded across all pipelines in this process (IMAGE_CONCURRENCY)
+            async with get_scheduler().stage("image"):
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(url, json=payload, timeout=120)
+                    response.raise_for_status()
+                    data = response.json()
+                    
+                    if not data.get("success"):
+                        raise Exception(f"Airbrush API error: {data}")
+                        
+                    image_url = data["data"]["image_url"]
+                    
+                    # Download the image
+                    img_response = await client.get(image_url, timeout=60, follow_redirects=True)
+                    img_response.raise_for_status()
             
             # Ensure output directory exists
             output_path = Path(output_dir)
@@ -66,10 +101,16 @@ def generate_image(prompt: str, output_dir: str = "generated_images") -> str:
             filename = f"{uuid.uuid4()}.png"
             file_path = output_path / filename
             
-            with open(file_path, "wb") as f:
-                f.write(img_response.content)
-                
-            return str(file_path.absolute())
+            await asyncio.to_thread(file_path.write_bytes, img_response.content)
+            
+            try:
+                saved_path = await asyncio.to_thread(
+                    get_artifact_catalog().record_image, str(file_path.absolute()), prompt
+                )
+            except Exception as e:
+                print(f"⚠️  Could not record image in artifact catalog: {e}")
+                saved_path = str(file_path.absolute())
+            return _remember_image(tool_context, anchor, prompt, saved_path)
             
         except Exception as e:
             print(f"Error generating image (attempt {attempt + 1}/{max_retries}) for prompt '{prompt[:50]}...': {e}")
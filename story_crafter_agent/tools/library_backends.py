@@ -0,0 +1,313 @@
+"""
+Library Backends
+
+Pluggable sources for the library tools.
+
+- `HttpLibraryBackend`: the Phase 1 Book Summaries API over HTTP.
+- `EmbeddedLibraryBackend`: serves the catalog, details and characters
+  in-process from the local book cache and metadata files.
+- `FallbackLibraryBackend`: tries HTTP first and falls back to the embedded
+  backend when the API is unreachable.
+- `CachedLibraryBackend`: memoizes details and characters around any of
+  the above (the process-wide backend is always wrapped in it), in-process
+  or in a cross-process `SharedCache` when `SHARED_CACHE_PATH` is set.
+
+Select one with the `LIBRARY_BACKEND` environment variable
+(`http`, `embedded` or `auto`, the default).
+"""
+
+import copy
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import httpx
+
+from story_crafter_agent.shared_state import file_stamp, get_shared_cache, get_snapshot
+from story_crafter_agent.tools.book_text import BOOKS_DIR
+from story_crafter_agent.tools.digest_tools import load_digest
+from story_crafter_agent.tools.gutenberg_ingest import CATALOG_PATH, load_catalog, parse_header
+
+METADATA_DIR = Path(__file__).parent.parent / "cache" / "metadata"
+
+API_BASE_URL = os.getenv("LIBRARY_API_URL", "http://127.0.0.1:8010")
+API_KEY = os.getenv("PHASE1_API_KEY", "")
+
+
+class LibraryBackend(ABC):
+    """Interface of a book catalog. Methods raise on failure."""
+
+    name = "base"
+
+    @abstractmethod
+    def list_books(self, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """List books with id, title, author, genre and overview."""
+
+    @abstractmethod
+    def get_book(self, book_id: str) -> Dict[str, Any]:
+        """Get the full details and summary of a book."""
+
+    @abstractmethod
+    def get_characters(self, book_id: str) -> List[Dict[str, Any]]:
+        """Get the characters of a book."""
+
+
+class HttpLibraryBackend(LibraryBackend):
+    """Phase 1 Book Summaries API client, sharing one connection pool."""
+
+    name = "http"
+
+    def __init__(self, base_url: str = API_BASE_URL, api_key: str = API_KEY, timeout: float = 10.0):
+        headers = {"accept": "application/json"}
+        if api_key:
+            headers["x-api-key"] = api_key
+        self._client = httpx.Client(base_url=base_url, headers=headers, timeout=timeout)
+
+    def _get(self, path: str, params: Optional[Dict[str, str]] = None) -> Any:
+        response = self._client.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def list_books(self, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        params = {"category": category} if category else None
+        return self._get("/books", params=params)
+
+    def get_book(self, book_id: str) -> Dict[str, Any]:
+        return self._get(f"/books/{book_id}")
+
+    def get_characters(self, book_id: str) -> List[Dict[str, Any]]:
+        return self._get(f"/books/{book_id}/characters")
+
+
+class EmbeddedLibraryBackend(LibraryBackend):
+    """
+    In-process library built from local files.
+
+    Books come from `cache/books/*.txt` and the ingestion catalog
+    (`cache/library/catalog.json`); descriptive fields (genre, overview,
+    plot, characters, themes) come from `cache/metadata/<book_id>.json`.
+
+    Only books with a metadata file are listed, since a bulk ingest can add
+    thousands of bare catalog entries; every ingested book can still be
+    looked up by ID.
+    """
+
+    name = "embedded"
+
+    def __init__(self, books_dir: Path = BOOKS_DIR, metadata_dir: Path = METADATA_DIR):
+        self._books_dir = books_dir
+        self._metadata_dir = metadata_dir
+        self._books: Optional[Dict[str, Dict[str, Any]]] = None
+        self._stamp: Optional[List[Optional[int]]] = None
+
+    def stamp(self) -> List[Optional[int]]:
+        """Modification times of the catalog, the book and metadata directories and the metadata files."""
+        return file_stamp(CATALOG_PATH, self._books_dir, self._metadata_dir,
+                          *sorted(self._metadata_dir.glob("*.json")))
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """The library, rebuilt whenever the files it is built from change."""
+        stamp = self.stamp()
+        if self._books is not None and self._stamp == stamp:
+            return self._books
+
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            books = snapshot.get_fresh("library", stamp)
+            if books is not None:
+                self._books, self._stamp = books, stamp
+                return books
+
+        books: Dict[str, Dict[str, Any]] = {}
+        for book_id, entry in load_catalog().items():
+            books[book_id] = {
+                "id": book_id,
+                "title": entry["title"],
+                "author": entry["author"],
+                "language": entry["language"],
+                "chapters": entry.get("chapter_count", 0),
+            }
+        for file_path in sorted(self._books_dir.glob("*.txt")):
+            with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+                header = parse_header(f.read(10_000), file_path.stem)
+            books.setdefault(file_path.stem, {
+                "id": file_path.stem,
+                "title": header["title"],
+                "author": header["author"],
+                "language": header["language"],
+            })
+        for file_path in sorted(self._metadata_dir.glob("*.json")):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+            book = books.setdefault(file_path.stem, {"id": file_path.stem})
+            book.update(metadata)
+
+        self._books, self._stamp = books, stamp
+        return books
+
+    def _book(self, book_id: str) -> Dict[str, Any]:
+        books = self._load()
+        if book_id not in books:
+            raise KeyError(f"Book {book_id} not found in the local library")
+        return books[book_id]
+
+    def list_books(self, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        books = []
+        for book in self._load().values():
+            if "overview" not in book and "genre" not in book:
+                continue
+            if category and category.lower() not in book.get("genre", "").lower():
+                continue
+            books.append({
+                "id": book["id"],
+                "title": book.get("title", ""),
+                "author": book.get("author", ""),
+                "genre": book.get("genre", ""),
+                "overview": book.get("overview", ""),
+            })
+        return books
+
+    def get_book(self, book_id: str) -> Dict[str, Any]:
+        book = dict(self._book(book_id))
+        digest = load_digest(book_id)
+        if digest is not None:
+            book.setdefault("summary", digest["book"]["summary"])
+        return book
+
+    def get_characters(self, book_id: str) -> List[Dict[str, Any]]:
+        return list(self._book(book_id).get("characters", []))
+
+
+class FallbackLibraryBackend(LibraryBackend):
+    """
+    Use the primary backend, falling back when it cannot be reached or
+    fails with a server error (5xx); client errors such as 404 are raised.
+
+    After such a failure the primary is skipped for `retry_after`
+    seconds so that every lookup does not wait on a dead service.
+    """
+
+    name = "auto"
+
+    def __init__(self, primary: LibraryBackend, fallback: LibraryBackend, retry_after: float = 30.0):
+        self._primary = primary
+        self._fallback = fallback
+        self._retry_after = retry_after
+        self._primary_down_until = 0.0
+
+    def _call(self, method: str, *args):
+        if time.monotonic() >= self._primary_down_until:
+            try:
+                return getattr(self._primary, method)(*args)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if isinstance(e, httpx.HTTPStatusError):
+                    if e.response.status_code < 500:
+                        raise
+                    reason = f"HTTP {e.response.status_code}"
+                else:
+                    reason = e.__class__.__name__
+                print(f"⚠️  Library API unavailable ({reason}), using {self._fallback.name} backend")
+                self._primary_down_until = time.monotonic() + self._retry_after
+        return getattr(self._fallback, method)(*args)
+
+    def list_books(self, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self._call("list_books", category)
+
+    def get_book(self, book_id: str) -> Dict[str, Any]:
+        return self._call("get_book", book_id)
+
+    def get_characters(self, book_id: str) -> List[Dict[str, Any]]:
+        return self._call("get_characters", book_id)
+
+
+class MemoryCache:
+    """In-process TTL cache with the same interface as `SharedCache`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple] = {}  # key -> (expires_at, value)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return copy.deepcopy(entry[1])
+            return None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, copy.deepcopy(value))
+
+
+class CachedLibraryBackend(LibraryBackend):
+    """
+    Memoize book details and characters for `ttl` seconds.
+
+    The catalog listing is not cached so that category filters and newly
+    ingested books always show up. Failed lookups are not cached. The store
+    is in-process by default, or a `SharedCache` shared by all workers.
+    """
+
+    name = "cached"
+
+    def __init__(self, inner: LibraryBackend, ttl: float = 600.0, store=None):
+        self._inner = inner
+        self._ttl = ttl
+        self._store = store if store is not None else MemoryCache()
+
+    def _cached(self, key: str, load):
+        value = self._store.get(key)
+        if value is None:
+            value = load()
+            self._store.set(key, value, self._ttl)
+        return value
+
+    def is_cached(self, method: str, book_id: str) -> bool:
+        """Whether a lookup would be served from the cache."""
+        return self._store.get(f"library:{method}:{book_id}") is not None
+
+    def list_books(self, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self._inner.list_books(category)
+
+    def get_book(self, book_id: str) -> Dict[str, Any]:
+        return self._cached(f"library:get_book:{book_id}", lambda: self._inner.get_book(book_id))
+
+    def get_characters(self, book_id: str) -> List[Dict[str, Any]]:
+        return self._cached(f"library:get_characters:{book_id}", lambda: self._inner.get_characters(book_id))
+
+
+_backend: Optional[LibraryBackend] = None
+
+
+def create_library_backend(kind: Optional[str] = None) -> LibraryBackend:
+    """Create a backend by name: 'http', 'embedded' or 'auto'."""
+    kind = (kind or os.getenv("LIBRARY_BACKEND", "auto")).lower()
+    if kind == "http":
+        return HttpLibraryBackend()
+    if kind == "embedded":
+        return EmbeddedLibraryBackend()
+    if kind == "auto":
+        return FallbackLibraryBackend(HttpLibraryBackend(), EmbeddedLibraryBackend())
+    raise ValueError(f"Unknown LIBRARY_BACKEND: {kind!r} (expected http, embedded or auto)")
+
+
+def get_library_backend() -> LibraryBackend:
+    """Return the process-wide library backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        _backend = CachedLibraryBackend(
+            create_library_backend(),
+            ttl=float(os.getenv("LIBRARY_CACHE_TTL", "600")),
+            store=get_shared_cache(),
+        )
+    return _backend
+
+
+def set_library_backend(backend: LibraryBackend) -> None:
+    """Replace the process-wide library backend."""
+    global _backend
+    _backend = backend
@@ -4,9 +4,11 @@ Personalization Tools
 Tools for capturing user preferences.
 """
 
-from google.adk.tools import FunctionTool
+from google.adk.tools import FunctionTool, ToolContext
 from typing import List, Dict, Any, Optional
 
+from story_crafter_agent.tools.prefetch_tools import start_prefetch
+
 @FunctionTool
 def submit_personalization_profile(
     audience: str,
@@ -14,6 +16,7 @@ def submit_personalization_profile(
     length: str,
     originality_score: float,
     special_adaptations: List[str],
+    tool_context: ToolContext,
     book_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """
@@ -30,12 +33,17 @@ def submit_personalization_profile(
     Returns:
         The confirmed profile dictionary.
     """
-    return {
+    if book_id:
+        # No-op when the book was already prefetched at selection time
+        start_prefetch(book_id, tool_context)
+    profile = {
         "audience": audience,
         "tone": tone,
         "length": length,
         "originality_score": originality_score,
         "special_adaptations": special_adaptations,
         "book_id": book_id,
-        "status": "confirmed"
     }
+    # Kept in session state so later stages (e.g. the artifact catalog) can read it
+    tool_context.state["personalization_profile"] = profile
+    return {**profile, "status": "confirmed"}
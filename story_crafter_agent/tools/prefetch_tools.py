@@ -0,0 +1,184 @@
+"""
+Prefetch Tools
+
+Speculative warm-up of book assets while the personalization interview runs.
+
+When a book is confirmed (by the LibraryAgent, or by the PersonalizationAgent
+in the served app, which starts there), a background task loads the book
+details and characters into the library cache and loads the digest, which
+is what the StoryTellerAgent reads, so it starts with everything warm.
+Prefetches are shared across sessions (one task per book) and cancelled
+once no session needs them any more.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, Set, List
+
+from google.adk.tools import ToolContext
+
+from story_crafter_agent.tools.digest_tools import load_digest
+from story_crafter_agent.tools.library_backends import get_library_backend
+
+# Re-run a finished prefetch after this long, matching the library cache TTL
+PREFETCH_TTL = 600.0
+
+
+class _PrefetchTask:
+    def __init__(self, book_id: str):
+        self.book_id = book_id
+        self.owners: Set[str] = set()
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+        self.steps: List[str] = []
+        self.errors: List[str] = []
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    def status(self) -> Dict[str, Any]:
+        if self.cancelled.is_set():
+            state = "cancelled"
+        elif self.finished_at is not None:
+            state = "warm"
+        else:
+            state = "running"
+        return {
+            "book_id": self.book_id,
+            "state": state,
+            "steps_done": list(self.steps),
+            "errors": list(self.errors),
+        }
+
+
+class BookPrefetcher:
+    """Runs at most one prefetch per book, shared by every session that needs it."""
+
+    def __init__(self, max_workers: int = 2, ttl: float = PREFETCH_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, _PrefetchTask] = {}
+
+    def start(self, book_id: str, owner: str) -> Dict[str, Any]:
+        """Start (or join) the prefetch for a book on behalf of `owner`."""
+        with self._lock:
+            task = self._tasks.get(book_id)
+            expired = task is not None and task.finished_at is not None \
+                and time.monotonic() - task.finished_at > self._ttl
+            if task is None or task.cancelled.is_set() or expired:
+                task = _PrefetchTask(book_id)
+                self._tasks[book_id] = task
+                task.future = self._executor.submit(self._run, task)
+            task.owners.add(owner)
+            return task.status()
+
+    def release(self, book_id: str, owner: str) -> None:
+        """Drop `owner`'s interest; cancel the prefetch if it was the last one."""
+        with self._lock:
+            task = self._tasks.get(book_id)
+            if task is None:
+                return
+            task.owners.discard(owner)
+            if not task.owners and task.finished_at is None:
+                self._cancel(task)
+
+    def cancel(self, book_id: str) -> None:
+        """Cancel a book's prefetch regardless of owners."""
+        with self._lock:
+            task = self._tasks.get(book_id)
+            if task is not None:
+                self._cancel(task)
+
+    def _cancel(self, task: _PrefetchTask) -> None:
+        task.cancelled.set()
+        if task.future is not None:
+            task.future.cancel()
+        self._tasks.pop(task.book_id, None)
+
+    def status(self, book_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            task = self._tasks.get(book_id)
+            return task.status() if task else None
+
+    def wait(self, book_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until a running prefetch finishes (or `timeout` elapses)."""
+        with self._lock:
+            task = self._tasks.get(book_id)
+        if task is None or task.future is None:
+            return None
+        try:
+            task.future.result(timeout=timeout)
+        except Exception:
+            pass
+        return task.status()
+
+    def _run(self, task: _PrefetchTask) -> None:
+        backend = get_library_backend()
+        steps = [
+            ("details", lambda: backend.get_book(task.book_id)),
+            ("characters", lambda: backend.get_characters(task.book_id)),
+            ("digest", lambda: load_digest(task.book_id)),
+        ]
+        for name, step in steps:
+            if task.cancelled.is_set():
+                return
+            try:
+                step()
+                task.steps.append(name)
+            except Exception as e:
+                # Missing assets just mean the storyteller fetches them later
+                task.errors.append(f"{name}: {e}")
+        task.finished_at = time.monotonic()
+
+
+_prefetcher: Optional[BookPrefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> BookPrefetcher:
+    """Return the process-wide prefetcher."""
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = BookPrefetcher()
+        return _prefetcher
+
+
+def start_prefetch(book_id: str, tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    Start prefetching a book for the current session.
+
+    The session's previous selection, if different, is released so its
+    prefetch is cancelled when no other session needs it.
+    """
+    state = tool_context.state
+    owner = state.get("prefetch_owner")
+    if not owner:
+        owner = uuid.uuid4().hex
+        state["prefetch_owner"] = owner
+
+    prefetcher = get_prefetcher()
+    previous = state.get("selected_book_id")
+    if previous and previous != book_id:
+        prefetcher.release(previous, owner)
+    state["selected_book_id"] = book_id
+    return prefetcher.start(book_id, owner)
+
+
+def confirm_book_selection(book_id: str, tool_context: ToolContext) -> Dict[str, Any]:
+    """
+    Confirm the user's book choice and start preparing it in the background.
+
+    Call this as soon as the user has chosen a book, before the
+    personalization interview.
+
+    Args:
+        book_id: The ID of the selected book (e.g., '1268').
+
+    Returns:
+        The selected book ID and its prefetch status.
+    """
+    status = start_prefetch(book_id, tool_context)
+    return {"book_id": book_id, "status": "confirmed", "prefetch": status["state"]}
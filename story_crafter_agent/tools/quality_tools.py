@@ -0,0 +1,340 @@
+"""
+Quality Tools
+
+Deterministic quality gate for generated stories.
+
+Checks the output of `submit_story_with_prompts` against the rules in
+`prompts/storyteller_agent.md` without another model call:
+- word count against the Short/Medium/Full targets
+- readability (Flesch-Kincaid grade) against the audience
+- every `[IMAGE_N]` anchor has a prompt, and at most 6 images
+- Parts instead of "Chapter" labels
+
+`score_parts` applies the same checks to each `## Part N:` section, so
+repairs can target only the Parts that fail.
+
+Text features are extracted with a handful of regex passes per story and
+all scoring is done on numpy arrays, so a batch of candidates is scored in
+one call in a few milliseconds.
+"""
+
+import re
+from typing import List, Dict, Any, Optional, Sequence, Union
+
+import numpy as np
+
+from story_crafter_agent.tools.story_parts import parse_story
+
+MAX_IMAGES = 6
+
+# (min words, max words, min images, max images) from the storyteller length guide
+LENGTH_TARGETS = {
+    "short": (600, 800, 2, 3),
+    "medium": (1000, 1500, 4, 5),
+    "full": (2000, 3000, 5, 6),
+}
+
+# Acceptable Flesch-Kincaid grade range per audience
+AUDIENCE_GRADES = {
+    "child": (0.0, 5.0),
+    "teen": (4.0, 10.0),
+    "adult": (6.0, 16.0),
+}
+
+# From the storyteller prompt: each Part has substantial content
+MIN_PART_WORDS = 150
+
+# Word counts this far outside the target range are errors, closer ones warnings
+LENGTH_TOLERANCE = 0.1
+
+_ANCHOR_RE = re.compile(r"\[(IMAGE_\d+)\]")
+_HEADING_RE = re.compile(r"^#+ .*$", re.MULTILINE)
+_PART_RE = re.compile(r"^## Part \d+:", re.MULTILINE)
+# Chapter headings, or lines that are a chapter label ("Chapter IV", "CHAPTER 2: The Storm");
+# case-sensitive so prose like "the chapter I had marked" is not a label
+_CHAPTER_RE = re.compile(
+    r"^#+\s*(?i:chapter)\b"
+    r"|^(?:Chapter|CHAPTER)\s+(?:\d+|[IVXLC]+|One|Two|Three|Four|Five|Six|ONE|TWO|THREE|FOUR|FIVE|SIX)\b"
+    r"(?=\s*(?:[:.\-–—]|$))",
+    re.MULTILINE,
+)
+_WORD_RE = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)?")
+# A terminator may be followed by closing quotes or brackets: 'he said."', '(really!)'
+_SENTENCE_RE = re.compile(r"[.!?]+[\"'”’)\]]*(?=\s|$)")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+# Trailing silent "e" (but not "-le" as in "little"), and words without vowels
+_SILENT_E_RE = re.compile(r"[a-z][^aeiouyl\W]e\b")
+_NO_VOWEL_RE = re.compile(r"\b[b-df-hj-np-tv-xz]+\b")
+
+# Weight of each check in the overall score
+_CHECK_WEIGHTS = {
+    "length": 0.3,
+    "readability": 0.25,
+    "anchors": 0.25,
+    "image_count": 0.1,
+    "structure": 0.1,
+}
+
+
+def normalize_audience(audience: Optional[str]) -> str:
+    """Map a free-form audience ('Child 5-8', 'Teenager', ...) to a grade band."""
+    text = (audience or "").lower()
+    if "child" in text or "kid" in text:
+        return "child"
+    if "teen" in text or "young" in text:
+        return "teen"
+    return "adult"
+
+
+def _prompt_keys(image_prompts: Optional[Dict[str, str]]) -> set:
+    """Prompt keys as anchor names, accepting both 'IMAGE_1' and '[IMAGE_1]'."""
+    return {
+        key.strip().strip("[]") for key, value in (image_prompts or {}).items()
+        if value and str(value).strip()
+    }
+
+
+def _features(story_text: str, image_prompts: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """Counts and anchor sets for one story."""
+    text = story_text or ""
+    anchors = _ANCHOR_RE.findall(text)
+    prose = _ANCHOR_RE.sub(" ", _HEADING_RE.sub(" ", text))
+    lowered = prose.lower()
+    words = len(_WORD_RE.findall(prose))
+    syllables = (
+        len(_VOWEL_GROUP_RE.findall(lowered))
+        - len(_SILENT_E_RE.findall(lowered))
+        + len(_NO_VOWEL_RE.findall(lowered))
+    )
+    prompts = _prompt_keys(image_prompts)
+    return {
+        "words": words,
+        "sentences": len(_SENTENCE_RE.findall(prose)),
+        "syllables": max(syllables, words),
+        "anchors": anchors,
+        "missing_prompts": sorted(set(anchors) - prompts, key=_anchor_number),
+        "unused_prompts": sorted(prompts - set(anchors), key=_anchor_number),
+        "duplicate_anchors": sorted({a for a in anchors if anchors.count(a) > 1}, key=_anchor_number),
+        "parts": len(_PART_RE.findall(text)),
+        "chapter_labels": len(_CHAPTER_RE.findall(text)),
+    }
+
+
+def _anchor_number(anchor: str) -> int:
+    digits = anchor.rsplit("_", 1)[-1]
+    return int(digits) if digits.isdigit() else 0
+
+
+def _broadcast(value: Union[str, Sequence[str], None], n: int) -> List[Optional[str]]:
+    if value is None or isinstance(value, str):
+        return [value] * n
+    values = list(value)
+    if len(values) != n:
+        raise ValueError(f"Expected {n} values, got {len(values)}")
+    return values
+
+
+def score_stories(
+    story_texts: Sequence[str],
+    image_prompts: Sequence[Optional[Dict[str, str]]],
+    length: Union[str, Sequence[str], None] = "Medium",
+    audience: Union[str, Sequence[str], None] = "Adult",
+) -> List[Dict[str, Any]]:
+    """
+    Score a batch of candidate stories.
+
+    Args:
+        story_texts: Story markdown, one per candidate.
+        image_prompts: Anchor -> prompt mapping, one per candidate.
+        length: Requested length (Short/Medium/Full), for all candidates or one each.
+        audience: Target audience, for all candidates or one each.
+
+    Returns:
+        One report per candidate with `passed` (no errors), `score` (0-1),
+        the `metrics` and the list of `issues` (each with a severity).
+    """
+    n = len(story_texts)
+    if len(image_prompts) != n:
+        raise ValueError(f"Expected {n} image prompt mappings, got {len(image_prompts)}")
+    if n == 0:
+        return []
+    lengths = [(l or "medium").strip().lower() for l in _broadcast(length, n)]
+    audiences = [normalize_audience(a) for a in _broadcast(audience, n)]
+    features = [_features(t, p) for t, p in zip(story_texts, image_prompts)]
+
+    words = np.array([f["words"] for f in features], dtype=float)
+    sentences = np.maximum(np.array([f["sentences"] for f in features], dtype=float), 1.0)
+    syllables = np.array([f["syllables"] for f in features], dtype=float)
+    images = np.array([len(set(f["anchors"])) for f in features])
+    missing = np.array([len(f["missing_prompts"]) for f in features])
+    duplicates = np.array([len(f["duplicate_anchors"]) for f in features])
+    parts = np.array([f["parts"] for f in features])
+    chapters = np.array([f["chapter_labels"] for f in features])
+
+    targets = np.array([LENGTH_TARGETS.get(l, LENGTH_TARGETS["medium"]) for l in lengths], dtype=float)
+    min_words, max_words, min_images, max_images = targets.T
+    grade_range = np.array([AUDIENCE_GRADES[a] for a in audiences])
+    min_grade, max_grade = grade_range.T
+
+    # Flesch-Kincaid grade level
+    safe_words = np.maximum(words, 1.0)
+    grade = 0.39 * (words / sentences) + 11.8 * (syllables / safe_words) - 15.59
+    grade = np.where(words > 0, np.maximum(grade, 0.0), 0.0)
+
+    # Relative distance outside the target range (0 inside it)
+    length_gap = np.maximum(min_words - words, 0) / min_words + np.maximum(words - max_words, 0) / max_words
+    grade_gap = np.maximum(min_grade - grade, 0) + np.maximum(grade - max_grade, 0)
+
+    checks = {
+        "length": np.clip(1.0 - length_gap / (2 * LENGTH_TOLERANCE), 0.0, 1.0),
+        "readability": np.clip(1.0 - grade_gap / 3.0, 0.0, 1.0),
+        "anchors": np.where(images > 0, np.clip(1.0 - (missing + duplicates) / np.maximum(images, 1), 0.0, 1.0), 0.0),
+        "image_count": np.where(images > MAX_IMAGES, 0.0, np.where(images < min_images, 0.5, 1.0)),
+        "structure": np.where(chapters > 0, 0.0, np.where(parts == 0, 0.5, 1.0)),
+    }
+    score = sum(weight * checks[name] for name, weight in _CHECK_WEIGHTS.items())
+
+    reports = []
+    for i, f in enumerate(features):
+        issues: List[Dict[str, str]] = []
+
+        def issue(check: str, severity: str, message: str) -> None:
+            issues.append({"check": check, "severity": severity, "message": message})
+
+        if length_gap[i] > LENGTH_TOLERANCE:
+            issue("length", "error", f"{int(words[i])} words; {lengths[i].title()} stories need "
+                  f"{int(min_words[i])}-{int(max_words[i])}")
+        elif length_gap[i] > 0:
+            issue("length", "warning", f"{int(words[i])} words, slightly outside "
+                  f"{int(min_words[i])}-{int(max_words[i])}")
+        if grade_gap[i] > 2.0:
+            issue("readability", "error", f"Reading grade {grade[i]:.1f}; {audiences[i]} audience needs "
+                  f"{min_grade[i]:.0f}-{max_grade[i]:.0f}")
+        elif grade_gap[i] > 0:
+            issue("readability", "warning", f"Reading grade {grade[i]:.1f}, slightly outside "
+                  f"{min_grade[i]:.0f}-{max_grade[i]:.0f}")
+        if images[i] == 0:
+            issue("anchors", "error", "No [IMAGE_N] anchors in the story")
+        if f["missing_prompts"]:
+            issue("anchors", "error", f"Anchors without a prompt: {', '.join(f['missing_prompts'])}")
+        if f["duplicate_anchors"]:
+            issue("anchors", "error", f"Anchors used more than once: {', '.join(f['duplicate_anchors'])}")
+        if f["unused_prompts"]:
+            issue("anchors", "warning", f"Prompts without an anchor: {', '.join(f['unused_prompts'])}")
+        if images[i] > MAX_IMAGES:
+            issue("image_count", "error", f"{images[i]} images; the maximum is {MAX_IMAGES}")
+        elif 0 < images[i] < min_images[i]:
+            issue("image_count", "warning", f"{images[i]} images; {lengths[i].title()} stories have "
+                  f"{int(min_images[i])}-{int(max_images[i])}")
+        if chapters[i]:
+            issue("structure", "error", "Uses 'Chapter' labels; structure the story in '## Part N:' sections")
+        elif parts[i] == 0:
+            issue("structure", "warning", "No '## Part N:' sections")
+
+        reports.append({
+            "passed": not any(x["severity"] == "error" for x in issues),
+            "score": round(float(score[i]), 3),
+            "metrics": {
+                "words": int(words[i]),
+                "sentences": int(sentences[i]),
+                "reading_grade": round(float(grade[i]), 1),
+                "audience": audiences[i],
+                "images": int(images[i]),
+                "parts": int(parts[i]),
+            },
+            "issues": issues,
+        })
+    return reports
+
+
+def score_story(
+    story_text: str,
+    image_prompts: Optional[Dict[str, str]],
+    length: Optional[str] = "Medium",
+    audience: Optional[str] = "Adult",
+) -> Dict[str, Any]:
+    """Score a single story (see `score_stories`)."""
+    return score_stories([story_text], [image_prompts], length, audience)[0]
+
+
+def score_parts(
+    story_text: str,
+    image_prompts: Optional[Dict[str, str]],
+    length: Optional[str] = "Medium",
+    audience: Optional[str] = "Adult",
+) -> List[Dict[str, Any]]:
+    """
+    Check each Part of a story on its own.
+
+    A Part fails when it is too short, has an anchor without a prompt (or an
+    anchor used elsewhere too), uses a "Chapter" label, or misses the
+    audience's reading level. When the whole story is too short, Parts under
+    the minimum are blamed first, then those under their share of the target;
+    when it is too long, Parts over their share fail.
+
+    Returns:
+        One report per Part with `number`, `title`, `passed`, `metrics`,
+        `issues` and `target_words` (the Part's share of the length target).
+    """
+    parts = parse_story(story_text)["parts"]
+    if not parts:
+        return []
+    length_key = (length or "medium").strip().lower()
+    min_words, max_words, _, _ = LENGTH_TARGETS.get(length_key, LENGTH_TARGETS["medium"])
+    band = normalize_audience(audience)
+    min_grade, max_grade = AUDIENCE_GRADES[band]
+
+    all_anchors = [a for part in parts for a in part["anchors"]]
+    features = [_features(part["text"], image_prompts) for part in parts]
+    words = np.array([f["words"] for f in features], dtype=float)
+    sentences = np.maximum(np.array([f["sentences"] for f in features], dtype=float), 1.0)
+    syllables = np.array([f["syllables"] for f in features], dtype=float)
+    grade = 0.39 * (words / sentences) + 11.8 * (syllables / np.maximum(words, 1.0)) - 15.59
+    grade = np.where(words > 0, np.maximum(grade, 0.0), 0.0)
+    grade_gap = np.maximum(min_grade - grade, 0) + np.maximum(grade - max_grade, 0)
+
+    # Each Part's share of the story target, and which Parts to blame for a bad total
+    n = len(parts)
+    share_min, share_max = min_words / n, max_words / n
+    total = words.sum()
+    too_short_story = total < min_words * (1 - LENGTH_TOLERANCE)
+    too_long_story = total > max_words * (1 + LENGTH_TOLERANCE)
+    length_fail = words < MIN_PART_WORDS
+    if too_short_story and not length_fail.any():
+        length_fail = words < share_min
+    if too_long_story:
+        length_fail |= words > share_max
+
+    reports = []
+    for i, (part, f) in enumerate(zip(parts, features)):
+        issues: List[Dict[str, str]] = []
+        if length_fail[i]:
+            issues.append({"check": "length", "severity": "error", "message": (
+                f"{int(words[i])} words; this Part should have about {int(share_min)}-{int(share_max)}"
+                f" (at least {MIN_PART_WORDS})")})
+        if f["missing_prompts"]:
+            issues.append({"check": "anchors", "severity": "error",
+                           "message": f"Anchors without a prompt: {', '.join(f['missing_prompts'])}"})
+        shared = sorted({a for a in part["anchors"] if all_anchors.count(a) > 1}, key=_anchor_number)
+        if shared:
+            issues.append({"check": "anchors", "severity": "error",
+                           "message": f"Anchors used more than once in the story: {', '.join(shared)}"})
+        if f["chapter_labels"]:
+            issues.append({"check": "structure", "severity": "error", "message": "Uses 'Chapter' labels"})
+        if grade_gap[i] > 2.0:
+            issues.append({"check": "readability", "severity": "error", "message": (
+                f"Reading grade {grade[i]:.1f}; {band} audience needs {min_grade:.0f}-{max_grade:.0f}")})
+
+        reports.append({
+            "number": part["number"],
+            "title": part["title"],
+            "passed": not issues,
+            "target_words": [int(share_min), int(share_max)],
+            "metrics": {
+                "words": int(words[i]),
+                "reading_grade": round(float(grade[i]), 1),
+                "images": len(part["anchors"]),
+            },
+            "issues": issues,
+        })
+    return reports
@@ -0,0 +1,235 @@
+"""
+Repair Tools
+
+Part-level regeneration of a submitted story.
+
+Instead of rewriting the whole story when the quality gate fails, only the
+failing `## Part N:` sections are regenerated, each with its neighbouring
+Parts as context, and spliced back into the story. Untouched Parts keep
+their text, anchors and image prompts, so the images already generated for
+those anchors in this story (session state `STORY_IMAGES_KEY`) are reused
+instead of being generated again.
+"""
+
+import asyncio
+import json
+import os
+from typing import List, Dict, Any, Optional
+
+from google.adk.tools import ToolContext
+
+from story_crafter_agent.tools.quality_tools import score_story, score_parts
+from story_crafter_agent.tools.story_parts import (
+    PART_HEADING_RE,
+    ANCHOR_RE,
+    parse_story,
+    render_story,
+    replace_part,
+    anchor_numbers,
+)
+
+REPAIR_MODEL = os.getenv("REPAIR_MODEL", "gemini-2.5-pro")
+
+# Characters of each neighbouring Part given to the model as context
+NEIGHBOUR_CONTEXT_CHARS = 1500
+
+_REPAIR_PROMPT = """You are revising one Part of a story adapted from a classic book.
+Rewrite ONLY Part {number} so that it fixes the problems listed below, and keep it
+consistent with the Parts around it.
+
+Audience: {audience}
+Tone: {tone}
+Length: {length} (this Part should have {min_words}-{max_words} words)
+
+Problems to fix:
+{issues}
+{instructions}
+Rules:
+- Start with the heading line exactly as: ## Part {number}: <evocative name>
+- Do not use "Chapter" labels.
+- Keep these image anchors, each exactly once, at natural moments: {anchors}
+- Do not add any other image anchors{new_anchor_rule}.
+
+Previous Part (end):
+{previous}
+
+Current Part {number}:
+{current}
+
+Next Part (beginning):
+{following}
+
+Respond with JSON: {{"text": "<the full rewritten Part>", "image_prompts": {{"IMAGE_N": "<prompt>"}}}}
+Only include image_prompts for anchors listed as needing a new prompt: {needs_prompts}."""
+
+
+def _format_issues(issues: List[Dict[str, str]]) -> str:
+    if not issues:
+        return "- (none reported; follow the instructions)"
+    return "\n".join(f"- {issue['message']}" for issue in issues)
+
+
+async def _repair_part(
+    client,
+    story: Dict[str, Any],
+    report: Dict[str, Any],
+    image_prompts: Dict[str, str],
+    profile: Dict[str, Any],
+    instructions: str,
+    spare_anchor: str,
+) -> Dict[str, Any]:
+    """Regenerate one Part; returns its new text and any new image prompts."""
+    number = report["number"]
+    numbers = [p["number"] for p in story["parts"]]
+    position = numbers.index(number)
+    part = story["parts"][position]
+    previous = story["parts"][position - 1]["text"][-NEIGHBOUR_CONTEXT_CHARS:] if position > 0 else "(start of story)"
+    following = story["parts"][position + 1]["text"][:NEIGHBOUR_CONTEXT_CHARS] \
+        if position + 1 < len(story["parts"]) else "(end of story)"
+
+    # Anchors seen earlier in the story are taken; duplicates are dropped here
+    taken = {a for p in story["parts"][:position] for a in p["anchors"]}
+    keep = list(dict.fromkeys(a for a in part["anchors"] if a not in taken))
+    needs_prompts = [a for a in keep if not image_prompts.get(a)]
+    if part["anchors"] and not keep:
+        keep, needs_prompts = [spare_anchor], [spare_anchor]
+
+    prompt = _REPAIR_PROMPT.format(
+        number=number,
+        audience=profile.get("audience") or "Adult",
+        tone=profile.get("tone") or "as in the rest of the story",
+        length=profile.get("length") or "Medium",
+        min_words=report["target_words"][0],
+        max_words=report["target_words"][1],
+        issues=_format_issues(report["issues"]),
+        instructions=f"\nAdditional instructions: {instructions}\n" if instructions else "",
+        anchors=", ".join(f"[{a}]" for a in keep) or "(none)",
+        new_anchor_rule="" if not needs_prompts else " (write a new image prompt for each anchor that needs one)",
+        previous=previous,
+        current=part["text"].strip(),
+        following=following,
+        needs_prompts=", ".join(needs_prompts) or "none",
+    )
+    response = await client.aio.models.generate_content(
+        model=REPAIR_MODEL,
+        contents=prompt,
+        config={"response_mime_type": "application/json"},
+    )
+    data = json.loads(response.text or "{}")
+    text = (data.get("text") or "").strip()
+    if not text:
+        raise ValueError("The model returned an empty Part")
+
+    # Keep the Part addressable even if the model changed or dropped the heading
+    heading = PART_HEADING_RE.match(text)
+    if heading is None:
+        text = part["text"].split("\n", 1)[0] + "\n\n" + text
+    elif int(heading.group(1)) != number:
+        text = f"## Part {number}:" + heading.group(0).split(":", 1)[1] + text[heading.end():]
+
+    # Anchors outside the allowed set would have no prompt (or clash with another Part)
+    text = ANCHOR_RE.sub(lambda m: m.group(0) if m.group(1) in keep else "", text)
+    # Anchors the model dropped go at the end, so their images are not lost
+    dropped = [a for a in keep if f"[{a}]" not in text]
+    if dropped:
+        text = text.rstrip() + "\n\n" + "\n".join(f"[{a}]" for a in dropped)
+    new_prompts = {
+        key.strip().strip("[]"): value
+        for key, value in (data.get("image_prompts") or {}).items()
+        if key.strip().strip("[]") in needs_prompts and value
+    }
+    return {"number": number, "text": text, "image_prompts": new_prompts}
+
+
+async def repair_story_parts(
+    tool_context: ToolContext,
+    part_numbers: Optional[List[int]] = None,
+    instructions: str = "",
+) -> Dict[str, Any]:
+    """
+    Regenerate only the failing Parts of the submitted story and splice them back in.
+
+    Use this instead of rewriting the whole story when the quality report of
+    `submit_story_with_prompts` lists `failing_parts`. Parts that are not
+    repaired keep their text and image prompts.
+
+    Args:
+        part_numbers: Parts to regenerate (e.g., [2, 4]). Defaults to the Parts
+            that fail the quality checks.
+        instructions: Optional extra guidance for the rewrite (e.g., 'make it less scary').
+
+    Returns:
+        The updated story_text, image_prompts and quality report, plus the
+        repaired and unchanged Part numbers.
+    """
+    from google import genai
+
+    state = tool_context.state
+    story_text = state.get("story_text")
+    image_prompts = {k.strip().strip("[]"): v for k, v in (state.get("image_prompts") or {}).items()}
+    if not story_text:
+        return {"error": "No submitted story to repair; call submit_story_with_prompts first"}
+
+    profile = state.get("personalization_profile") or {}
+    length = profile.get("length") or "Medium"
+    audience = profile.get("audience") or "Adult"
+    story = parse_story(story_text)
+    if not story["parts"]:
+        return {"error": "The story has no '## Part N:' sections; resubmit it with submit_story_with_prompts"}
+
+    reports = {r["number"]: r for r in score_parts(story_text, image_prompts, length, audience)}
+    if part_numbers:
+        unknown = [n for n in part_numbers if n not in reports]
+        if unknown:
+            return {"error": f"Unknown Part numbers: {unknown}", "parts": sorted(reports)}
+        targets = list(dict.fromkeys(part_numbers))
+    else:
+        targets = [n for n, r in reports.items() if not r["passed"]]
+    if not targets:
+        return {
+            "status": "nothing_to_repair",
+            "story_text": story_text,
+            "image_prompts": image_prompts,
+            "quality": state.get("story_quality") or score_story(story_text, image_prompts, length, audience),
+        }
+
+    # Each repaired Part gets its own spare anchor number in case it needs a new image
+    next_anchor = max(anchor_numbers(story) + [0]) + 1
+    client = genai.Client()
+    results = await asyncio.gather(*(
+        _repair_part(client, story, reports[n], image_prompts, profile, instructions, f"IMAGE_{next_anchor + i}")
+        for i, n in enumerate(targets)
+    ), return_exceptions=True)
+
+    repaired, failed = [], []
+    for number, result in zip(targets, results):
+        if isinstance(result, Exception):
+            print(f"⚠️  Could not repair Part {number}: {result}")
+            failed.append({"number": number, "error": str(result)})
+            continue
+        story = replace_part(story, number, result["text"])
+        image_prompts.update(result["image_prompts"])
+        repaired.append(number)
+
+    # Drop prompts whose anchors were removed; everything else is kept as-is
+    used = {a for part in story["parts"] for a in part["anchors"]}
+    image_prompts = {k: v for k, v in image_prompts.items() if k in used}
+
+    story_text = render_story(story)
+    quality = score_story(story_text, image_prompts, length, audience)
+    quality["failing_parts"] = [r["number"] for r in score_parts(story_text, image_prompts, length, audience)
+                                if not r["passed"]]
+    state["story_text"] = story_text
+    state["image_prompts"] = image_prompts
+    state["story_quality"] = quality
+
+    response = {
+        "story_text": story_text,
+        "image_prompts": image_prompts,
+        "quality": quality,
+        "repaired_parts": repaired,
+        "unchanged_parts": [p["number"] for p in story["parts"] if p["number"] not in repaired],
+    }
+    if failed:
+        response["failed_parts"] = failed
+    return response
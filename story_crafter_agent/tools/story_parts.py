@@ -0,0 +1,90 @@
+"""
+Story Parts
+
+Story markdown as a list of addressable Parts.
+
+The storyteller prompt mandates this structure:
+
+    # Title
+
+    ## Part 1: The Mysterious Stranger
+    ...
+    [IMAGE_1]
+
+    ## Part 2: Into the Storm
+    ...
+
+`parse_story` splits a story into its preamble (title and anything before
+the first Part) and Parts; `render_story` joins them back. Re-rendering an
+unmodified story reproduces the original text exactly, so individual Parts
+can be replaced without touching the rest.
+"""
+
+import re
+from typing import List, Dict, Any
+
+PART_HEADING_RE = re.compile(r"^## Part (\d+):[^\n]*$", re.MULTILINE)
+ANCHOR_RE = re.compile(r"\[(IMAGE_\d+)\]")
+
+
+def parse_story(story_text: str) -> Dict[str, Any]:
+    """
+    Split a story into preamble and Parts.
+
+    Returns:
+        {"preamble": str, "parts": [{"number", "title", "text", "anchors"}, ...]}
+        where each Part's `text` starts with its heading and includes the
+        whitespace up to the next Part.
+    """
+    text = story_text or ""
+    headings = list(PART_HEADING_RE.finditer(text))
+    if not headings:
+        return {"preamble": text, "parts": []}
+
+    parts = []
+    for i, heading in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        part_text = text[heading.start():end]
+        parts.append({
+            "number": int(heading.group(1)),
+            "title": heading.group(0).split(":", 1)[1].strip(),
+            "text": part_text,
+            "anchors": ANCHOR_RE.findall(part_text),
+        })
+    return {"preamble": text[:headings[0].start()], "parts": parts}
+
+
+def render_story(story: Dict[str, Any]) -> str:
+    """Join a parsed story back into markdown."""
+    return story["preamble"] + "".join(part["text"] for part in story["parts"])
+
+
+def replace_part(story: Dict[str, Any], number: int, part_text: str) -> Dict[str, Any]:
+    """
+    Return a copy of `story` with Part `number` replaced by `part_text`.
+
+    The blank lines that separated the old Part from the next one are kept,
+    so the new text does not need to end with them.
+    """
+    parts = []
+    for part in story["parts"]:
+        if part["number"] != number:
+            parts.append(part)
+            continue
+        trailing = part["text"][len(part["text"].rstrip()):]
+        new_text = part_text.strip() + trailing
+        heading = PART_HEADING_RE.match(new_text)
+        parts.append({
+            **part,
+            "title": heading.group(0).split(":", 1)[1].strip() if heading else part["title"],
+            "text": new_text,
+            "anchors": ANCHOR_RE.findall(new_text),
+        })
+    return {"preamble": story["preamble"], "parts": parts}
+
+
+def anchor_numbers(story: Dict[str, Any]) -> List[int]:
+    """Numbers of all image anchors used in the story."""
+    return [int(a.rsplit("_", 1)[1]) for part in story["parts"] for a in part["anchors"]] + [
+        int(a.rsplit("_", 1)[1]) for a in ANCHOR_RE.findall(story["preamble"])
+    ]
@@ -1,16 +1,49 @@
-from typing import Dict
+from typing import Dict, Optional
 
-def submit_story_with_prompts(story_text: str, image_prompts: Dict[str, str]):
+from google.adk.tools import ToolContext
+
+from story_crafter_agent.tools.image_generation_tools import STORY_IMAGES_KEY
+from story_crafter_agent.tools.quality_tools import score_story, score_parts
+
+def submit_story_with_prompts(
+    story_text: str,
+    image_prompts: Dict[str, str],
+    tool_context: Optional[ToolContext] = None
+):
     """
     Submits the generated story text and associated image prompts.
-    
+
+    The story is checked against the personalization profile (length,
+    reading level, image anchors, Part structure). If `quality.passed` is
+    false, repair the `quality.failing_parts` with `repair_story_parts`, or
+    fix the listed errors and submit again.
+
     Args:
         story_text: The full text of the story, containing anchors like [IMAGE_1].
         image_prompts: A dictionary mapping anchors (e.g., "IMAGE_1") to image descriptions.
     """
+    profile = {}
+    if tool_context is not None:
+        profile = tool_context.state.get("personalization_profile") or {}
+    length = profile.get("length") or "Medium"
+    audience = profile.get("audience") or "Adult"
+    quality = score_story(story_text, image_prompts, length=length, audience=audience)
+    quality["failing_parts"] = [
+        part["number"] for part in score_parts(story_text, image_prompts, length, audience)
+        if not part["passed"]
+    ]
+    if tool_context is not None:
+        # repair_story_parts works on the last submitted story
+        tool_context.state["story_text"] = story_text
+        tool_context.state["image_prompts"] = image_prompts
+        tool_context.state["story_quality"] = quality
+        # A new story: images of the previous one are not reused
+        tool_context.state[STORY_IMAGES_KEY] = {}
+
     # In a real agent system, this might save to a context or database.
     # For now, it acts as a structured output for the agent.
     return {
         "story_text": story_text,
-        "image_prompts": image_prompts
+        "image_prompts": image_prompts,
+        "quality": quality,
     }